@@ -0,0 +1,338 @@
+import os
+import shutil
+import numpy as np
+from streams import uniform
+
+
+class Adjacency:
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray):
+        """
+            Sparse symmetric adjacency structure stored in CSR form.
+            The neighbours of node i are indices[indptr[i]:indptr[i+1]]. The CSR arrays hold the static
+            base network and are never modified after construction. Edges added during a day are kept in
+            a small overlay edge list and removed (quarantined) nodes are masked out, both are composed
+            with the base network on the fly, so memory grows with the number of edges, not n^2.
+            params: indptr: np.ndarray of shape (n+1,), offsets of each row in indices
+                    indices: np.ndarray of shape (nnz,), sorted neighbour indices of each row
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.n = len(indptr) - 1
+        self.removed = np.zeros(self.n, dtype=bool)
+        self.overlay = np.empty((16, 2), dtype=np.int64)  # undirected edges added on top of the base network
+        self.n_overlay = 0
+        self._overlay_keys = set()  # (min, max) pairs of the overlay edges for O(1) lookups
+        self._patch = None  # filtered rows of the nodes next to removed nodes, together with the mask they were built for
+        self._base_keys = None  # sorted keys of the base edges for vectorized lookups, built on first use
+        self.path = None  # directory the base network is memory mapped from, see load
+
+
+    @classmethod
+    def from_edges(cls, n: int, src: np.ndarray, dst: np.ndarray) -> "Adjacency":
+        """
+            Build a symmetric adjacency structure from an undirected edge list.
+            params: n: int, number of nodes
+                    src: np.ndarray, first endpoint of each edge
+                    dst: np.ndarray, second endpoint of each edge
+            returns: Adjacency
+        """
+        rows = np.concatenate((src, dst))
+        cols = np.concatenate((dst, src))
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, cols[order].astype(np.int32))
+
+
+    def save(self, path: str) -> None:
+        """
+            Save the base network to the directory path, as one .npy file per CSR array.
+            The directory is written next to path first and then moved in place, so readers never see half
+            a network. The overlay and the removed nodes are not saved.
+            params: path: str, directory to create, an existing directory is replaced
+        """
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'indptr.npy'), self.indptr)
+        np.save(os.path.join(tmp_path, 'indices.npy'), self.indices)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "Adjacency":
+        """
+            Load a base network saved with save.
+            With mmap the CSR arrays are read-only memory maps of the files, so all runs and worker processes
+            that load the same network share its pages in memory instead of each holding a copy. Such an
+            adjacency is pickled as its path, e.g. when it is sent to a worker process or saved in a checkpoint.
+            params: path: str, directory written by save
+                    mmap: bool, memory map the arrays instead of reading them into memory
+            returns: Adjacency
+        """
+        mmap_mode = 'r' if mmap else None
+        adjacency = cls(np.load(os.path.join(path, 'indptr.npy'), mmap_mode=mmap_mode),
+                        np.load(os.path.join(path, 'indices.npy'), mmap_mode=mmap_mode))
+        if mmap:
+            adjacency.path = path
+        return adjacency
+
+
+    def view(self) -> "Adjacency":
+        """
+            Return a new adjacency on the same (read-only) base network, without overlay edges and removed nodes.
+        """
+        new = Adjacency(self.indptr, self.indices)
+        new.path = self.path
+        new._base_keys = self._base_keys
+        return new
+
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if self.path is not None:
+            # a memory mapped network is mapped again from its files when unpickled
+            del state['indptr'], state['indices']
+            state['_base_keys'] = None
+        return state
+
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if 'indptr' not in state:
+            self.indptr = np.load(os.path.join(self.path, 'indptr.npy'), mmap_mode='r')
+            self.indices = np.load(os.path.join(self.path, 'indices.npy'), mmap_mode='r')
+
+
+    def __len__(self) -> int:
+        return self.n
+
+
+    def neighbours(self, i: int) -> np.ndarray:
+        """
+            Return the indices of all current contacts of node i.
+            params: i: int, index of the node
+            returns: np.ndarray of neighbour indices
+        """
+        if self.removed[i]:
+            return np.empty(0, dtype=np.int64)
+        overlay = self.overlay[:self.n_overlay]
+        idx = np.concatenate((self.indices[self.indptr[i]:self.indptr[i + 1]],
+                              overlay[overlay[:, 0] == i, 1], overlay[overlay[:, 1] == i, 0]))
+        return idx[~self.removed[idx]]
+
+
+    def has_edge(self, i: int, j: int) -> bool:
+        """
+            Check whether nodes i and j are connected, ignoring removed nodes.
+        """
+        row = self.indices[self.indptr[i]:self.indptr[i + 1]]
+        pos = np.searchsorted(row, j)
+        if pos < len(row) and row[pos] == j:
+            return True
+        return (min(i, j), max(i, j)) in self._overlay_keys
+
+
+    def has_edges(self, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """
+            Vectorized has_edge, check for every k whether nodes src[k] and dst[k] are connected.
+            returns: np.ndarray of bools
+        """
+        if self._base_keys is None:
+            # row * n + column of every base edge, sorted as the rows and the columns within a row are
+            self._base_keys = np.repeat(np.arange(self.n, dtype=np.int64), np.diff(self.indptr)) * self.n + self.indices
+        keys = np.asarray(src, dtype=np.int64) * self.n + dst
+        pos = np.minimum(np.searchsorted(self._base_keys, keys), len(self._base_keys) - 1)
+        found = self._base_keys[pos] == keys if len(self._base_keys) else np.zeros(len(keys), dtype=bool)
+        if self._overlay_keys:
+            lo, hi = np.minimum(src, dst).tolist(), np.maximum(src, dst).tolist()
+            found |= np.fromiter(((a, b) in self._overlay_keys for a, b in zip(lo, hi)), dtype=bool, count=len(lo))
+        return found
+
+
+    def add_edge(self, i: int, j: int) -> None:
+        """
+            Add an undirected edge between nodes i and j to the overlay.
+        """
+        self.add_edges(np.array([i]), np.array([j]))
+
+
+    def add_edges(self, src: np.ndarray, dst: np.ndarray) -> None:
+        """
+            Add undirected edges (src[k], dst[k]) to the overlay.
+        """
+        m = self.n_overlay + len(src)
+        if m > len(self.overlay):
+            grown = np.empty((max(m, 2 * len(self.overlay)), 2), dtype=np.int64)
+            grown[:self.n_overlay] = self.overlay[:self.n_overlay]
+            self.overlay = grown
+        self.overlay[self.n_overlay:m, 0] = np.minimum(src, dst)
+        self.overlay[self.n_overlay:m, 1] = np.maximum(src, dst)
+        self._overlay_keys.update(zip(self.overlay[self.n_overlay:m, 0].tolist(), self.overlay[self.n_overlay:m, 1].tolist()))
+        self.n_overlay = m
+
+
+    def clear_overlay(self) -> None:
+        """
+            Remove all edges added on top of the base network, this costs O(number of overlay edges).
+        """
+        self.n_overlay = 0
+        self._overlay_keys.clear()
+
+
+    def sample_neighbours(self, rng: np.random.Generator, nodes: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Draw one random contact for every node that has at least one contact, in a single pass.
+            The contact of node i is found at offset floor(u * degree[i]) in its row, with u uniform in [0, 1).
+            params: rng: np.random.Generator or ReplicateStreams, random stream to draw from
+                    nodes: np.ndarray, sorted indices of the nodes to draw a contact for, all nodes if not given
+            returns: (nodes, contacts) np.ndarrays, contacts[k] is the drawn contact of nodes[k]
+        """
+        nodes, start, base_degree, patch = self._rows(nodes)
+        overlay_start, overlay_degree, overlay_dst = self._overlay_rows(nodes)
+        degree = base_degree + overlay_degree
+
+        has_contacts = degree > 0
+        nodes, degree = nodes[has_contacts], degree[has_contacts]
+        start, base_degree, overlay_start = start[has_contacts], base_degree[has_contacts], overlay_start[has_contacts]
+
+        offset = (uniform(rng, nodes) * degree).astype(np.int64)
+        contacts = np.empty(len(nodes), dtype=np.int64)
+
+        # offsets past the end of the CSR row continue in the overlay edges of the node
+        in_base = offset < base_degree
+        contacts[in_base] = self._take(start[in_base] + offset[in_base], patch)
+        in_overlay = ~in_base
+        contacts[in_overlay] = overlay_dst[overlay_start[in_overlay] + offset[in_overlay] - base_degree[in_overlay]]
+        return nodes, contacts
+
+
+    def neighbours_of(self, nodes: np.ndarray) -> np.ndarray:
+        """
+            Return the current contacts of all given nodes, concatenated and possibly with duplicates.
+            params: nodes: np.ndarray, sorted node indices
+            returns: np.ndarray of neighbour indices
+        """
+        _, start, degree, patch = self._rows(nodes)
+        overlay_start, overlay_degree, overlay_dst = self._overlay_rows(nodes)
+        return np.concatenate((self._take(_ranges(start, degree), patch), overlay_dst[_ranges(overlay_start, overlay_degree)]))
+
+
+    def _rows(self, nodes: np.ndarray = None) -> tuple:
+        """
+            Return the CSR rows of the given nodes, all nodes if not given, without removed nodes.
+            Rows are read from the shared base network where possible. Rows that lose contacts to removed
+            nodes are filtered into a small private patch, positions from len(indices) on refer to the patch.
+            returns: (nodes, start, degree, patch), the row of nodes[k] is at positions start[k]:start[k] + degree[k],
+                     see _take
+        """
+        if nodes is None:
+            nodes = np.arange(self.n)
+            start, degree = self.indptr[:-1].astype(np.int64), np.diff(self.indptr)
+            if not self.removed.any():
+                return nodes, start, degree, None
+            if self._patch is None or not np.array_equal(self._patch[0], self.removed):
+                # only the removed nodes and their neighbours have other rows than in the base network
+                removed = np.flatnonzero(self.removed)
+                touched = np.union1d(removed, self.indices[_ranges(self.indptr[removed], np.diff(self.indptr)[removed])])
+                _, patch_start, patch_degree, patch = self._filter_rows(touched)
+                self._patch = (self.removed.copy(), touched, patch_start + len(self.indices), patch_degree, patch)
+            _, touched, patch_start, patch_degree, patch = self._patch
+            start[touched], degree[touched] = patch_start, patch_degree
+            return nodes, start, degree, patch
+
+        _, start, degree, patch = self._filter_rows(nodes)
+        return nodes, start + len(self.indices), degree, patch
+
+
+    def _filter_rows(self, nodes: np.ndarray) -> tuple:
+        """
+            Gather the base rows of the given nodes without removed nodes, removed nodes get an empty row.
+            returns: (nodes, start, degree, indices), the row of nodes[k] is indices[start[k]:start[k] + degree[k]]
+        """
+        start = self.indptr[nodes]
+        degree = self.indptr[nodes + 1] - start
+        indices = self.indices[_ranges(start, degree)]
+        owner = np.repeat(np.arange(len(nodes)), degree)
+        keep = ~self.removed[indices] & ~self.removed[nodes][owner]
+        degree = np.bincount(owner[keep], minlength=len(nodes))
+        return nodes, np.cumsum(degree) - degree, degree, indices[keep]
+
+
+    def _take(self, positions: np.ndarray, patch: np.ndarray) -> np.ndarray:
+        """
+            Look up row positions as returned by _rows, in the base network or, from len(indices) on, in the patch.
+        """
+        in_base = positions < len(self.indices)
+        if in_base.all():
+            return self.indices[positions]
+        values = np.empty(len(positions), dtype=self.indices.dtype)
+        values[in_base] = self.indices[positions[in_base]]
+        values[~in_base] = patch[positions[~in_base] - len(self.indices)]
+        return values
+
+
+    def _overlay_rows(self, nodes: np.ndarray) -> tuple:
+        """
+            Return the overlay edges of the given nodes, grouped by node in the same way as the CSR rows.
+            returns: (start, degree, dst), the overlay contacts of nodes[k] are dst[start[k]:start[k] + degree[k]]
+        """
+        overlay_src, overlay_dst = self._overlay_edges()
+        order = np.argsort(overlay_src, kind='stable')
+        if len(nodes) == self.n:
+            # all nodes, counting is cheaper than searching
+            degree = np.bincount(overlay_src, minlength=self.n)
+            return np.cumsum(degree) - degree, degree, overlay_dst[order]
+        # a subset of the nodes, e.g. the active frontier, costs O(len(nodes) log(overlay edges)) and not O(n)
+        overlay_src = overlay_src[order]
+        start = np.searchsorted(overlay_src, nodes, side='left')
+        return start, np.searchsorted(overlay_src, nodes, side='right') - start, overlay_dst[order]
+
+
+    def _overlay_edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Return the overlay edges in both directions as (src, dst) arrays, without removed nodes.
+        """
+        overlay = self.overlay[:self.n_overlay]
+        overlay = overlay[~self.removed[overlay[:, 0]] & ~self.removed[overlay[:, 1]]]
+        return np.concatenate((overlay[:, 0], overlay[:, 1])), np.concatenate((overlay[:, 1], overlay[:, 0]))
+
+
+    def copy(self) -> "Adjacency":
+        """
+            Return a snapshot that shares the (read-only) CSR arrays with this adjacency.
+        """
+        new = self.view()
+        new.removed = self.removed.copy()
+        new.add_edges(self.overlay[:self.n_overlay, 0], self.overlay[:self.n_overlay, 1])
+        return new
+
+
+    def edges(self):
+        """
+            Iterate over all current undirected edges (i, j) with i < j.
+        """
+        for i in range(self.n):
+            for j in self.neighbours(i):
+                if i < j:
+                    yield i, int(j)
+
+
+    def to_dense(self) -> np.ndarray:
+        """
+            Return the dense adjacency matrix, only meant for small graphs.
+        """
+        A = np.zeros((self.n, self.n), dtype=int)
+        for i, j in self.edges():
+            A[i][j] = 1
+            A[j][i] = 1
+        return A
+
+
+def _ranges(start: np.ndarray, length: np.ndarray) -> np.ndarray:
+    """
+        Concatenation of the index ranges start[k] ... start[k] + length[k] - 1.
+    """
+    offsets = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    return np.repeat(start, length) + offsets
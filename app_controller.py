@@ -1,49 +1,118 @@
-import random
+import numpy as np
+from streams import uniform
 
 class App_controller:
-    def __init__(self, graph, quarantine_probability: float):
-        self.contacts = {}  # Dictionary mapping each person with the app to their contact history
+    def __init__(self, graph, quarantine_probability: float, rng: np.random.Generator = None,
+                 history_length: int = 4, contacts_per_day: int = 6):
+        """
+            Contact tracing app. The contact history of every app user is a fixed size ring buffer of
+            (contact, day) entries, entries older than history_length days are ignored when reading,
+            so they expire without being removed. When a user logs more contacts than fit in the buffer
+            the oldest entries are overwritten.
+            params: graph: Graph, graph the app users live in
+                    quarantine_probability: float, probability that a contact will quarantine when notified
+                    rng: np.random.Generator, random stream for notifications and self tests
+                    history_length: int, number of days before today that contacts are remembered
+                    contacts_per_day: int, number of contacts per day the ring buffer is sized for
+        """
         self.graph = graph
         self.quarantine_probability = quarantine_probability  # Probability that a contact will quarantine when notified
-    
+        self.rng = rng if rng is not None else np.random.default_rng()  # random stream for notifications and self tests
+        self.history_length = history_length
+        self.capacity = (history_length + 1) * contacts_per_day
+        self.cur_timestep = 0
+        self.set_app_users(np.empty(0, dtype=np.int64))
+
 
-    def set_app_users(self, app_users: dict):
-        self.contacts = app_users
+    def set_app_users(self, app_users: np.ndarray):
+        """
+            Give the app to the given persons and allocate their contact history.
+            params: app_users: np.ndarray, indices of the persons that use the app
+        """
+        n = len(self.graph.population)
+        self.slot = np.full(n, -1, dtype=np.int64)  # row in the contact history of each person, -1 without the app
+        self.slot[app_users] = np.arange(len(app_users))
+        self.contact_log = np.zeros((len(app_users), self.capacity), dtype=np.int32)
+        self.day_log = np.full((len(app_users), self.capacity), np.iinfo(np.int32).min, dtype=np.int32)
+        self.head = np.zeros(len(app_users), dtype=np.int64)  # number of entries ever written per user
 
 
-    def update_app(self, person1, contact, cur_timestep, history_length: int = 4) -> None:
+    def update_app(self, person1, contact, cur_timestep) -> None:
         """
             Update the app history with a new contact for a person.
             params: person1: Person, the person whose app history is to be updated
                     contact: Person, the new contact to add to the app history
         """
-        # this person does not have the app so do nothing
-        if person1 not in self.contacts:
-            return
-        
-        # the contact does not have the app so do nothing
-        if contact not in self.contacts:
-            return
-        
-        # add new contact with current timestep
-        self.contacts[person1].append((contact, cur_timestep))
+        self._log(np.array([person1.index]), np.array([contact.index]), cur_timestep)
+
+
+    def log_contacts(self, persons1: np.ndarray, persons2: np.ndarray, cur_timestep: int) -> None:
+        """
+            Log the interactions (persons1[k], persons2[k]) of today in the app history of both persons.
+            Interactions where one of both does not have the app are not logged.
+        """
+        self._log(np.concatenate((persons1, persons2)), np.concatenate((persons2, persons1)), cur_timestep)
+
+
+    def _log(self, users: np.ndarray, contacts: np.ndarray, cur_timestep: int) -> None:
+        """
+            Append contacts[k] to the ring buffer of users[k], for all k at once.
+        """
+        self.cur_timestep = cur_timestep
+        rows = self.slot[users]
+        both_have_app = (rows >= 0) & (self.slot[contacts] >= 0)
+        rows, contacts = rows[both_have_app], contacts[both_have_app]
+
+        # a user can log several contacts at once, each one goes to the next position of the ring buffer,
+        # the order of the contacts of one day in the buffer does not matter
+        order = np.argsort(rows)
+        rows, contacts = rows[order], contacts[order]
+        starts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+        rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.append(starts, len(rows))))
+        pos = (self.head[rows] + rank) % self.capacity
+        self.contact_log[rows, pos] = contacts
+        self.day_log[rows, pos] = cur_timestep
+        self.head += np.bincount(rows, minlength=len(self.head))
+
 
-        # remove old contacts beyond the history length
-        while self.contacts[person1] and (cur_timestep - self.contacts[person1][0][1]) > history_length:
-            self.contacts[person1].pop(0)  # remove oldest contact if it's older than desired history_length
+    def recent_contacts(self, persons: np.ndarray, cur_timestep: int = None) -> np.ndarray:
+        """
+            Return the contacts the persons logged in the last history_length days, persons without the app
+            have no logged contacts.
+            params: persons: np.ndarray, indices of the persons to look up
+                    cur_timestep: int, current day, defaults to the day of the last logged contact
+            returns: np.ndarray, indices of the recent contacts of all persons, a contact logged several times
+                     appears several times
+        """
+        if cur_timestep is None:
+            cur_timestep = self.cur_timestep
+        rows = self.slot[persons]
+        rows = rows[rows >= 0]
+        recent = self.day_log[rows] >= cur_timestep - self.history_length
+        return self.contact_log[rows][recent]
 
 
-    def trigger_quarantine(self, person) -> None:
+    def trigger_quarantine(self, person, cur_timestep: int = None) -> None:
         """
             Trigger quarantine notification for a person's recent contacts using the app.
             params: person: Person, the person who is Removed and whose contacts need to be notified
+                    cur_timestep: int, current day
         """
-        if person not in self.contacts:
-            return  # Person does not have the app, cannot trace contacts
+        self.trace_contacts(np.array([person.index]), cur_timestep)
+
 
-        # Get recent contacts from the app history
-        recent_contacts = [contact for contact, timestep in self.contacts[person]]
+    def trace_contacts(self, removed: np.ndarray, cur_timestep: int = None) -> None:
+        """
+            Notify the recent contacts of all persons that became Removed today at once.
+            Every logged contact is a separate chance to be notified, so a person that appears m times
+            in the histories is notified with probability 1 - (1 - quarantine_probability)^m. With self testing
+            every notification comes with its own test, see Graph.quarantine_people.
+            params: removed: np.ndarray, indices of the persons that became Removed
+                    cur_timestep: int, current day, defaults to the day of the last logged contact
+        """
+        # Get recent contacts from the app history of all removed persons, persons without the app cannot trace contacts
+        contacts, times_logged = np.unique(self.recent_contacts(removed, cur_timestep), return_counts=True)
 
-        for contact in recent_contacts:
-            if random.random() < self.quarantine_probability:   
-                self.graph.quarantine_person(contact)
\ No newline at end of file
+        p_notified = 1 - (1 - self.quarantine_probability) ** times_logged
+        notified = uniform(self.rng, contacts) < p_notified
+        self.graph.quarantine_people(contacts[notified], times_logged[notified])
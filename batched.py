@@ -0,0 +1,171 @@
+import numpy as np
+from adjacency import Adjacency
+from app_controller import App_controller
+from graph import Graph
+from population import Population, EXPOSED, INFECTED, REMOVED, SUSCEPTIBLE, QUARANTINE_EVENT_DTYPE
+from profiling import NULL_PROFILER
+from streams import ReplicateStreams, uniform
+
+# per person arrays of the population that are stacked over the replicates
+_POPULATION_ARRAYS = ('state', 'total_days', 'days_exposed', 'days_infected', 'quarantined', 'days_quarantined',
+                      'careless', 'app', 'transition_day', 'release_day')
+
+
+class BatchedGraph(Graph):
+    def __init__(self, graph_params: dict, seeds: list, graph_cache=None):
+        """
+            All replicates of one parameter cell, advanced together in lockstep.
+            Every replicate is built as its own Graph from its own seed, after which the replicates are stacked
+            into one population of (replicates x persons) arrays, replicate r holding the persons r * n up to
+            (r + 1) * n. The networks form a block diagonal adjacency structure, so persons only meet persons
+            of their own replicate. Every random number of a day is drawn from the streams of the replicate
+            it is for, so a replicate only depends on its own seed. It does not follow the same path as a
+            single Graph with that seed though, as the numbers are drawn in another order.
+            Replicates in which the disease died out are left out of the daily contacts and their history is
+            kept constant, like the early exit of a single run.
+            params: graph_params: dict, keyword arguments of Graph
+                    seeds: list of int, seed of every replicate
+                    graph_cache: GraphCache, cache to load the network of a network_seed from
+        """
+        if graph_cache is not None:
+            graph_params = graph_cache.with_network(graph_params)
+        replicates = [Graph(**graph_params, seed=seed) for seed in seeds]
+        first = replicates[0]
+        self.seeds = list(seeds)
+        self.n_replicates = len(replicates)
+        self.n = n = len(first.population)  # persons per replicate
+        self.number_neighbourhoods = first.number_neighbourhoods
+        self.number_residents = first.number_residents
+        self.include_quarantining = first.include_quarantining
+        self.include_self_test = first.include_self_test
+        self.active_frontier = first.active_frontier
+        self.profiler = NULL_PROFILER
+        self.contact_rng = ReplicateStreams([g.contact_rng for g in replicates], n)
+        offsets = np.arange(self.n_replicates) * n
+
+        # stack the populations
+        population = Population(self.n_replicates * n, rng=ReplicateStreams([g.population.rng for g in replicates], n),
+                                event_driven=first.population.event_driven)
+        for name in _POPULATION_ARRAYS:
+            setattr(population, name, np.concatenate([getattr(g.population, name) for g in replicates]))
+        population.counts = np.sum([g.population.counts for g in replicates], axis=0)
+        population.n_quarantined = sum(g.population.n_quarantined for g in replicates)
+        population.infected = np.concatenate([g.population.infected + offset for g, offset in zip(replicates, offsets)])
+        for g, offset in zip(replicates, offsets):
+            for calendar, stacked in ((g.population.transitions, population.transitions), (g.population.releases, population.releases)):
+                for day, events in calendar.items():
+                    stacked.setdefault(day, []).extend(indices + offset for indices in events)
+        self.population = population
+
+        # one app for all replicates, contacts are only logged within a replicate
+        self.app_users = np.concatenate([g.app_users + offset for g, offset in zip(replicates, offsets)])
+        self.app = App_controller(self, first.app.quarantine_probability,
+                                  rng=ReplicateStreams([g.app.rng for g in replicates], n),
+                                  history_length=first.app.history_length,
+                                  contacts_per_day=first.app.capacity // (first.app.history_length + 1))
+        self.app.set_app_users(self.app_users)
+
+        # block diagonal adjacency structure of the replicate networks
+        edge_offsets = np.concatenate(([0], np.cumsum([g.A.indptr[-1] for g in replicates])))
+        indptr = np.concatenate([[0]] + [g.A.indptr[1:] + edge_offset for g, edge_offset in zip(replicates, edge_offsets)])
+        indices = np.concatenate([g.A.indices + offset for g, offset in zip(replicates, offsets)]).astype(np.int64)
+        self.A = Adjacency(indptr, indices)
+        if self.include_quarantining:
+            self.remove_quarantined()
+
+        self.quarantine_log = np.empty(64, dtype=QUARANTINE_EVENT_DTYPE)
+        self.n_quarantine_events = 0
+
+        # histories per day of every replicate, rows are days
+        self.alive = np.ones(self.n_replicates, dtype=bool)
+        self.days_run = np.zeros(self.n_replicates, dtype=np.int64)  # days up to the day the disease died out
+        self.history = {name: [] for name in ('history_E', 'history_I', 'history_S', 'history_R', 'history_Q')}
+        self._replicate_state = np.repeat(np.arange(self.n_replicates) * 4, n)  # 4 * replicate of every person
+
+
+    def make_neighbourhood_contacts(self, percentage: int) -> None:
+        """
+            Give percentage percent of the residents of every replicate in which the disease is still alive a
+            contact with a random person outside their neighbourhood, drawn for all replicates at once.
+            A drawn person that already is a contact is drawn again, as in Graph.make_neighbourhood_contacts.
+        """
+        n_outside = self.n - self.number_residents
+        if n_outside == 0:
+            return  # only one neighbourhood, nobody to meet outside of it
+
+        k = int(self.n * (percentage / 100))
+        rngs = self.contact_rng.rngs
+        pending = np.concatenate([rngs[r].choice(self.n, k, replace=False) + r * self.n
+                                  for r in np.flatnonzero(self.alive)] or [np.empty(0, dtype=np.int64)])
+        while len(pending):
+            # skip over the own block of residents, as in Graph._draw_outside_neighbourhood
+            offset = pending - pending % self.n
+            local = pending - offset
+            j = (uniform(self.contact_rng, pending) * n_outside).astype(np.int64)
+            j += np.where(j >= local - local % self.number_residents, self.number_residents, 0)
+            contacts = j + offset
+
+            # a pair is new when it is not a contact yet and is drawn only once today
+            keys = np.minimum(pending, contacts) * len(self.A) + np.maximum(pending, contacts)
+            new = ~self.A.has_edges(pending, contacts)
+            first = np.zeros(len(pending), dtype=bool)
+            first[np.unique(keys, return_index=True)[1]] = True
+            accepted = new & first
+            self.A.add_edges(pending[accepted], contacts[accepted])
+            pending = pending[~accepted]
+
+
+    def _active_persons(self) -> np.ndarray:
+        """
+            Persons that draw a contact today, the persons of replicates in which the disease died out are left out.
+        """
+        active = super()._active_persons()
+        if active is not None:
+            return active[self.alive[active // self.n]]
+        if self.alive.all():
+            return None
+        return np.flatnonzero(np.repeat(self.alive, self.n))
+
+
+    def _record_history(self) -> None:
+        """
+            Append today's counts of every replicate, the counts of replicates that died out are kept constant.
+        """
+        population = self.population
+        counts = np.bincount(self._replicate_state + population.state, minlength=4 * self.n_replicates).reshape(-1, 4)
+        quarantined = population.quarantined.reshape(self.n_replicates, self.n).sum(axis=1)
+        today = {'history_E': counts[:, EXPOSED], 'history_I': counts[:, INFECTED], 'history_S': counts[:, SUSCEPTIBLE],
+                 'history_R': counts[:, REMOVED], 'history_Q': quarantined}
+        for name, values in today.items():
+            if self.history[name] and not self.alive.all():
+                values = np.where(self.alive, values, self.history[name][-1])
+            self.history[name].append(values)
+        self.days_run[self.alive] += 1
+        self.alive &= (self.history['history_E'][-1] + self.history['history_I'][-1]) > 0
+
+
+    def results(self) -> list[dict]:
+        """
+            Split the histories and the quarantine log into one result per replicate, the histories of a
+            replicate end at the day the disease died out in it.
+            returns: list of dicts in the format of run_simulation
+        """
+        history = {name: np.array(rows, dtype=np.int64).reshape(-1, self.n_replicates) for name, rows in self.history.items()}
+        events = self.quarantine_events
+        replicate = events['person'] // self.n
+        order = np.argsort(replicate, kind='stable')
+        bounds = np.searchsorted(replicate[order], np.arange(self.n_replicates + 1))
+
+        results = []
+        for r, seed in enumerate(self.seeds):
+            result = {}
+            for name, values in history.items():
+                result[name] = values[:self.days_run[r], r].tolist()
+            log = events[order[bounds[r]:bounds[r + 1]]].copy()
+            log['person'] -= r * self.n
+            result['history_quarantined'] = log['was_infected'][log['passed_self_test']].astype(np.int8)
+            result['quarantine_log'] = log
+            result['n_total'] = self.n
+            result['seed'] = seed
+            results.append(result)
+        return results
@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from graph import Graph
+from runner import run_simulation
+
+
+def git_commit() -> tuple:
+    """
+        returns: (commit hash, whether the working tree has uncommitted changes), ('unknown', False) outside git
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def graph_params(number_neighbourhoods: int, number_residents: int, app_usage_rate: float,
+                 event_driven: bool = False, active_frontier: bool = False) -> dict:
+    return dict(number_neighbourhoods=number_neighbourhoods,
+                number_residents=number_residents,
+                num_connections=4,
+                careless_prob=0.05,
+                rewire_prob=0.5,
+                include_quarantining=True,
+                app_usage_rate=app_usage_rate,
+                quarantine_probability=0.5,
+                include_self_test=True,
+                event_driven=event_driven,
+                active_frontier=active_frontier)
+
+
+def time_best(fn, repeats: int) -> tuple:
+    """
+        Call fn repeats times and return the shortest wall clock time and the result of that call.
+    """
+    best, result = np.inf, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        if elapsed < best:
+            best, result = elapsed, out
+    return best, result
+
+
+def peak_memory(fn) -> float:
+    """
+        returns: float, peak traced memory of a call of fn in MB, numpy arrays included
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_config(params: dict, percentage: float, num_days: int, day_samples: int, repeats: int,
+                 seed: int, measure_memory: bool) -> dict:
+    """
+        Benchmark graph construction, a single day and a full run of one configuration.
+        The single day is the mean over the first day_samples days of a run, as the cost of a day depends
+        on the number of infected persons.
+        returns: dict with the timings in seconds, person days per second and peak memory in MB
+    """
+    n = params['number_neighbourhoods'] * params['number_residents']
+
+    def construct():
+        return Graph(**params, seed=seed)
+
+    def days():
+        graph = construct()
+        start = time.perf_counter()
+        for i in range(day_samples):
+            graph.make_neighbourhood_contacts(percentage=percentage)
+            graph.timestep(i=i)
+            graph.delete_neighbourhood_contacts()
+        return (time.perf_counter() - start) / day_samples
+
+    def full_run():
+        return run_simulation(params, seed, num_days=num_days, percentage_neighbourhood_contacts=percentage)
+
+    # the simulation prints its progress, which is not part of the benchmark
+    with contextlib.redirect_stdout(io.StringIO()):
+        construct_s, _ = time_best(construct, repeats)
+        day_s = min(days() for _ in range(repeats))
+        run_s, result = time_best(full_run, repeats)
+        memory = peak_memory(full_run) if measure_memory else None
+
+    # a run ends early when the disease dies out, the remaining days are not simulated
+    days_run = len(result['history_E'])
+    return {
+        'n_persons': n,
+        'construct_s': construct_s,
+        'day_s': day_s,
+        'run_s': run_s,
+        'days_run': days_run,
+        'person_days_per_s': n * days_run / run_s,
+        'peak_memory_mb': memory,
+    }
+
+
+def run_benchmarks(sizes: list, app_usage_rates: list, percentages: list, num_days: int = 210,
+                   day_samples: int = 10, repeats: int = 3, seed: int = 0, measure_memory: bool = True,
+                   event_driven: bool = False, active_frontier: bool = False) -> dict:
+    """
+        Benchmark every combination of population size, app usage rate and percentage of long range contacts.
+        params: sizes: list of (number_neighbourhoods, residents_per_neighbourhood) tuples
+                app_usage_rates: list of floats
+                percentages: list of floats, percentage of residents that meet someone outside their neighbourhood each day
+        returns: dict with the environment and one entry per configuration under 'results'
+    """
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'settings': dict(num_days=num_days, day_samples=day_samples, repeats=repeats, seed=seed,
+                         event_driven=event_driven, active_frontier=active_frontier),
+        'results': [],
+    }
+    for number_neighbourhoods, number_residents in sizes:
+        for app_usage_rate in app_usage_rates:
+            for percentage in percentages:
+                params = graph_params(number_neighbourhoods, number_residents, app_usage_rate,
+                                      event_driven=event_driven, active_frontier=active_frontier)
+                entry = dict(number_neighbourhoods=number_neighbourhoods, residents_per_neighbourhood=number_residents,
+                             app_usage_rate=app_usage_rate, percentage_neighbourhood_contacts=percentage)
+                entry.update(bench_config(params, percentage, num_days, day_samples, repeats, seed, measure_memory))
+                report['results'].append(entry)
+                memory = f"{entry['peak_memory_mb']:.1f} MB" if measure_memory else "-"
+                print(f"{number_neighbourhoods}x{number_residents} app={app_usage_rate} contacts={percentage}: "
+                      f"construct {entry['construct_s'] * 1e3:.1f} ms, day {entry['day_s'] * 1e3:.2f} ms, "
+                      f"run {entry['run_s']:.2f} s ({entry['person_days_per_s']:.3g} person days/s), peak {memory}")
+    return report
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """
+        Print the speedup of every configuration that is in both benchmark reports.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    key = lambda r: (r['number_neighbourhoods'], r['residents_per_neighbourhood'], r['app_usage_rate'], r['percentage_neighbourhood_contacts'])
+    old_results = {key(r): r for r in old['results']}
+    print(f"{old['commit'][:10]} -> {new['commit'][:10]}, speedup (>1 is faster)")
+    for r in new['results']:
+        if key(r) not in old_results:
+            continue
+        o = old_results[key(r)]
+        print(f"{r['number_neighbourhoods']}x{r['residents_per_neighbourhood']} app={r['app_usage_rate']} "
+              f"contacts={r['percentage_neighbourhood_contacts']}: construct {o['construct_s'] / r['construct_s']:.2f}x, "
+              f"day {o['day_s'] / r['day_s']:.2f}x, person days/s {r['person_days_per_s'] / o['person_days_per_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark graph construction, a single day and a full run of the simulation.")
+    parser.add_argument('--sizes', default='10x100,50x100,100x100',
+                        help="comma separated neighbourhoods x residents, e.g. 10x100,50x100")
+    parser.add_argument('--app-usage-rates', default='0.75', help="comma separated app usage rates")
+    parser.add_argument('--percentages', default='1', help="comma separated percentages of long range contacts")
+    parser.add_argument('--days', type=int, default=210, help="number of days of a full run")
+    parser.add_argument('--day-samples', type=int, default=10, help="number of days the single day time is averaged over")
+    parser.add_argument('--repeats', type=int, default=3, help="the best of this many repeats is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help="skip the (slow) peak memory measurement")
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--active-frontier', action='store_true')
+    parser.add_argument('--output', help="json file to write, defaults to results/benchmarks/benchmark_<commit>_<time>.json")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two benchmark json files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        sizes = [tuple(int(x) for x in size.split('x')) for size in args.sizes.split(',')]
+        report = run_benchmarks(sizes,
+                                [float(x) for x in args.app_usage_rates.split(',')],
+                                [float(x) for x in args.percentages.split(',')],
+                                num_days=args.days, day_samples=args.day_samples, repeats=args.repeats, seed=args.seed,
+                                measure_memory=not args.no_memory, event_driven=args.event_driven,
+                                active_frontier=args.active_frontier)
+        output = args.output or os.path.join("results", "benchmarks",
+                                             f"benchmark_{report['commit'][:10]}_{datetime.now():%Y%m%d_%H%M%S}.json")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved benchmark to {output}")
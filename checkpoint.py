@@ -0,0 +1,83 @@
+import json
+import os
+import pickle
+from results_store import _read_index
+
+MANIFEST_FILE = 'sweep_manifest.json'
+
+
+class SweepManifest:
+    def __init__(self, folder_path: str):
+        """
+            Manifest of a parameter sweep, mapping every cell to the results store its runs are appended to.
+            The runs that are done are read from the index of each store, so restarting a sweep with the
+            same configuration skips every run that was stored before.
+            params: folder_path: str, folder holding the results stores and the manifest
+        """
+        self.path = os.path.join(folder_path, MANIFEST_FILE)
+        self.stores = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.stores = json.load(f)
+
+
+    def store_path(self, key: str, default: str) -> str:
+        """
+            Return the store of a cell, the default path is registered when the cell is not in the manifest yet.
+            params: key: str, description of the cell including everything that changes its results
+                    default: str, path of the store for a new cell
+        """
+        if key not in self.stores:
+            self.stores[key] = default
+            self._save()
+        return self.stores[key]
+
+
+    def completed(self, key: str) -> set:
+        """
+            returns: set of the seeds of the runs of a cell that are stored
+        """
+        if key not in self.stores:
+            return set()
+        return {run['seed'] for run in _read_index(self.stores[key])}
+
+
+    def _save(self) -> None:
+        _write_atomic(self.path, json.dumps(self.stores, indent=2).encode())
+
+
+def save_checkpoint(path: str, graph, day: int) -> None:
+    """
+        Save the full state of a running simulation after the given day, i.e. the population arrays,
+        the adjacency, the app histories and the state of every random stream.
+        params: path: str, file to write, replaced atomically so an interruption keeps the previous checkpoint
+                graph: Graph, graph of the simulation
+                day: int, last simulated day
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    _write_atomic(path, pickle.dumps({'day': day, 'graph': graph}, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_checkpoint(path: str):
+    """
+        returns: (graph, day) of the checkpoint, or (None, None) if there is no checkpoint
+    """
+    if not os.path.exists(path):
+        return None, None
+    with open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+    return checkpoint['graph'], checkpoint['day']
+
+
+def remove_checkpoint(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,16 +1,22 @@
-import random
 from neighbourhood import Neighourhood
-from person import Person
+from person import Person, Persons
+from population import Population, INFECTED, EXPOSED, SUSCEPTIBLE, REMOVED, QUARANTINE_EVENT_DTYPE
 import numpy as np
 from colorama import init, Fore, Back, Style
-import copy
+from adjacency import Adjacency
 from app_controller import App_controller
+from profiling import NULL_PROFILER
+from streams import uniform
 from plot import plot_data, plot_quarantained_bar
 import networkx as nx
 import configparser
 
 init(autoreset=True)  # colors reset after each print
 
+# version of build_network, increase it whenever a change to build_network changes the network it builds from
+# the same parameters and seed, so networks of the old version in the graph cache are not used anymore
+NETWORK_VERSION = 1
+
 
 class Graph:
         
@@ -20,7 +26,12 @@ class Graph:
                  include_quarantining: bool,
                  app_usage_rate: float = 1.0,
                  quarantine_probability: float = 0.5,
-                 include_self_test: bool = True):
+                 include_self_test: bool = True,
+                 seed: int = None,
+                 event_driven: bool = False,
+                 active_frontier: bool = False,
+                 network_seed: int = None,
+                 adjacency: Adjacency = None):
         """
             Initialize the graph with a given number of neighbourhoods and residents per neighbourhood.
             Each neighbourhood is represented as a Neighourhood object containing Person objects.
@@ -32,53 +43,75 @@ class Graph:
                     include_quarantining: bool, whether to include quarantining in the simulation
                     app_usage_rate: float, percentage of non-careless population to use the app
                     quarantine_probability: float, probability that a contact will quarantine when notified
+                    include_self_test: bool, whether notified contacts only quarantine after a positive self test
+                    seed: int, seed of the random streams of this graph, the same seed gives the exact same run
+                    event_driven: bool, whether the population only processes scheduled disease and quarantine events each day
+                    active_frontier: bool, whether only interactions that can spread the infection or are logged by the app are drawn
+                    network_seed: int, seed of the contact network, defaults to seed. Runs with the same network_seed
+                                  share the network and only differ in the epidemic
+                    adjacency: Adjacency, network built before by build_network, e.g. loaded read-only with
+                               Adjacency.load, it is shared instead of built again and must match the other parameters
         """
-        self.app = App_controller(self, quarantine_probability)
-        self.neigbourhoods = [Neighourhood(i, number_residents, self.app) for i in range(number_neighbourhoods)]
-        self.nodes = [x for n in self.neigbourhoods for x in n.residents]
+        # independent random streams for the network, the population, the daily contacts and the app
+        self.seed = seed
+        self.network_seed = seed if network_seed is None else network_seed
+        self.profiler = NULL_PROFILER  # replaced by a Profiler to time the phases of a day
+        _, population_seed, contact_seed, app_seed = np.random.SeedSequence(seed).spawn(4)
+        self.contact_rng = np.random.default_rng(contact_seed)
+
+        self.population = Population(number_neighbourhoods * number_residents, rng=np.random.default_rng(population_seed),
+                                     event_driven=event_driven)
+        self.app = App_controller(self, quarantine_probability, rng=np.random.default_rng(app_seed))
+        self.neigbourhoods = [Neighourhood(i, number_residents, self.app, self.population) for i in range(number_neighbourhoods)]
+        self.nodes = Persons(self.population, self.app, number_residents)
         self.number_neighbourhoods = number_neighbourhoods
         self.number_residents = number_residents
         self.include_quarantining = include_quarantining
         self.include_self_test = include_self_test
+        self.active_frontier = active_frontier
 
 
         self._make_careless(p=careless_prob)
 
         if self.include_quarantining:
             self.app_users = self._get_app_users(rate=app_usage_rate)
-            self.app.set_app_users(self.app_users)
         else:
-            self.app.set_app_users({})  # No one has the app if quarantining is not included
+            self.app_users = np.empty(0, dtype=np.int64)  # No one has the app if quarantining is not included
+        self.app.set_app_users(self.app_users)
 
         self.history_E = []
         self.history_I = []
         self.history_S = []
         self.history_R = []
+        self.history_Q = []  # number of persons in quarantine at the end of each day
 
-        self.history_quarantined = []
+        # log of every notification, grown by doubling, the first n_quarantine_events records are used
+        self.quarantine_log = np.empty(64, dtype=QUARANTINE_EVENT_DTYPE)
+        self.n_quarantine_events = 0
 
         # Infect 1% of the population at the start of the simulation
         self.first_infected_index = self._infect_first_people(p=0.01)  
 
-        self.A = self._make_ring_lattice(k=num_connections)
-
-        self._rewire_edges(rewire_prob)
-        self.copyA = copy.deepcopy(self.A)
+        if adjacency is None:
+            adjacency = self.build_network(number_neighbourhoods, number_residents, num_connections, rewire_prob, self.network_seed)
+        elif len(adjacency) != len(self.population):
+            raise ValueError(f"The network has {len(adjacency)} nodes, the population {len(self.population)}.")
+        # the base network is shared, the daily contacts and removed persons are kept per graph
+        self.A = adjacency.view()
+        if self.include_quarantining:
+            self.remove_quarantined()
 
-        print(f"Graph initialized with {len(self.nodes)} nodes in {self.number_neighbourhoods} neighbourhoods.")
+        print(f"Graph initialized with {len(self.population)} nodes in {self.number_neighbourhoods} neighbourhoods.")
 
     def _infect_first_people(self, p=0.0148):  #Prob as described in the paper we copy
         """
             Infect a percentage p of the population at the start of the simulation.
             params: p: float, percentage of population to infect
         """
-        total_population = len(self.nodes)
+        total_population = len(self.population)
         n_infected = max(1, int(total_population * p))  # Ensure at least one person is infected
-        infected_people = random.sample(self.nodes, n_infected)
-        infected_index = [self.nodes.index(person) for person in infected_people]
-        for person in infected_people:
-            person.infection_status = 'Infected'
-            #print(f"{person.name} has been initially infected!")
+        infected_index = self.population.rng.choice(total_population, n_infected, replace=False)
+        self.population.set_state(infected_index, INFECTED, SUSCEPTIBLE)
         return infected_index
     
     def _make_careless(self, p=0.05):
@@ -86,85 +119,120 @@ class Graph:
             Make a percentage p of the population careless.
             params: p: float, percentage of population to make careless
         """
-        total_population = len(self.nodes)
+        total_population = len(self.population)
         n_careless = int(total_population * p)
-        careless_people = random.sample(self.nodes, n_careless)
+        careless_index = self.population.rng.choice(total_population, n_careless, replace=False)
         #print(f"Making {n_careless} people careless.")
-        for person in careless_people:
-            person.careless = True
+        self.population.careless[careless_index] = True
 
 
     def _get_app_users(self, rate: float):
         """
             Set app users based on the given rate.
             params: rate: float, percentage of non-careless population to use the app
+            returns: np.ndarray, indices of the app users
         """
-        self.potential_app_users = {person: [] for person in self.nodes if not person.careless}
+        self.potential_app_users = np.flatnonzero(~self.population.careless)
         n_app_users = int(len(self.potential_app_users) * rate)
-        app_users = random.sample(list(self.potential_app_users.keys()), n_app_users)
-        return {person: [] for person in app_users}
+        app_users = np.sort(self.population.rng.choice(self.potential_app_users, n_app_users, replace=False))
+        self.population.app[app_users] = True
+        return app_users
 
 
-    def _make_ring_lattice(self, k: int) -> np.array:
+    @staticmethod
+    def build_network(number_neighbourhoods: int, number_residents: int, num_connections: int,
+                      rewire_prob: float, seed: int = None) -> Adjacency:
+        """
+            Build the small-world contact network of a graph, a rewired ring lattice in every neighbourhood.
+            The network only depends on its parameters and seed, Graph(..., seed=s) builds the same network
+            as build_network(..., seed=s).
+            params: seed: int, seed of the network, see the network_seed of Graph
+                    other params as in Graph
+            returns: Adjacency
+        """
+        # the network stream is the first of the streams of a graph with this seed
+        rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(4)[0])
+        n = number_neighbourhoods * number_residents
+        src, dst = Graph._make_ring_lattice(n, number_residents, k=num_connections)
+        src, dst = Graph._rewire_edges(src, dst, rewire_prob, n, number_residents, rng)
+        return Adjacency.from_edges(n, src, dst)
+
+    @staticmethod
+    def _make_ring_lattice(n: int, number_residents: int, k: int) -> tuple[np.ndarray, np.ndarray]:
         """
             given list of nodes make ring lattice with k neighbors
 
-            params: k: int, number of neighbors each node should have
-            returns: adjacency matrix np.array of shape (n, n) where n is number of nodes
+            params: n: int, number of nodes
+                    number_residents: int, number of nodes per neighbourhood
+                    k: int, number of neighbors each node should have
+            returns: edge list (src, dst) with every undirected edge once and src < dst
         
         """
      
         if k % 2 != 0:
             raise ValueError("k must be an even number for a symmetric ring lattice.")
 
-        n = len(self.nodes)
-        A = np.zeros((n, n), dtype=int) # Adjacency matrix initialized to 0
-        for i in range(n):
-            block_start = (i // self.number_residents) * self.number_residents
-            for j in range(1, k//2 + 1):
-                A[i][(i + j) % self.number_residents + block_start] = 1  # Connect to the next j nodes
-                A[i][(i - j) % self.number_residents + block_start] = 1  # Connect to the previous j nodes
-        return A
+        i = np.repeat(np.arange(n), k // 2)
+        offsets = np.tile(np.arange(1, k // 2 + 1), n)
+        block_start = (i // number_residents) * number_residents
+        j = (i + offsets) % number_residents + block_start  # Connect to the next k/2 nodes
+        keys = np.unique(np.minimum(i, j) * n + np.maximum(i, j))  # small neighbourhoods can wrap onto the same edge
+        return keys // n, keys % n
 
-    def _rewire_edges(self, p) -> None:
+    @staticmethod
+    def _rewire_edges(src: np.ndarray, dst: np.ndarray, p, n: int, number_residents: int,
+                      rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
         """
-            Given an adjacency matrix, rewire edges with probability p.
-            params: p: float, probability of rewiring each edge
+            Given an edge list, rewire edges with probability p.
+            A rewired edge (i, j) keeps i and gets a new random end point in the neighbourhood of i that is
+            not i and not yet connected to i. The draws are done for all rewired edges at once, draws that
+            hit an existing edge (or the same new edge twice) are repeated in the next round.
+            params: src, dst: np.ndarray, edge list with src < dst
+                    p: float, probability of rewiring each edge
+                    n: int, number of nodes
+                    number_residents: int, number of nodes per neighbourhood
+                    rng: np.random.Generator, network stream to draw from
+            returns: rewired edge list (src, dst)
         """
-        
-        A = self.A
-        n = len(A)
-        for i in range(n):
-            block_start = (i // self.number_residents) * self.number_residents
-            for j in range(i+1, n):  # Ensure each edge is considered only once
-                if A[i][j] == 1 and random.random() < p:
-                    
-                    # Remove the edge
-                    A[i][j] = 0
-                    A[j][i] = 0
-                    
-                    # Find a new node to connect to
-                    new_node = random.randint(block_start, block_start + self.number_residents - 1)
-                    while new_node == i or A[i][new_node] == 1:
-                        new_node = random.randint(block_start, block_start + self.number_residents - 1)
-                    #print(f'rewire edge between {i} and {j} to {new_node}')
-                    # Add the new edge
-                    A[i][new_node] = 1
-                    A[new_node][i] = 1
-        self.A = A 
+        rewire = rng.random(len(src)) < p
+
+        # keys i * n + j of all edges that stay, kept sorted for the duplicate check
+        kept_src, kept_dst = src[~rewire], dst[~rewire]
+        keys = np.sort(kept_src * n + kept_dst)
+
+        pending = src[rewire]
+        new_src, new_dst = [kept_src], [kept_dst]
+        while len(pending):
+            block_start = (pending // number_residents) * number_residents
+            new_node = block_start + rng.integers(0, number_residents, len(pending))
+            lo, hi = np.minimum(pending, new_node), np.maximum(pending, new_node)
+            new_keys = lo * n + hi
+
+            pos = np.minimum(np.searchsorted(keys, new_keys), len(keys) - 1)
+            free = (new_node != pending) & ((len(keys) == 0) | (keys[pos] != new_keys))
+            # accept only the first draw of every new edge
+            _, first = np.unique(new_keys[free], return_index=True)
+            accepted = np.flatnonzero(free)[first]
+
+            new_src.append(lo[accepted])
+            new_dst.append(hi[accepted])
+            keys = np.union1d(keys, new_keys[accepted])
+            pending = np.delete(pending, accepted)
+        return np.concatenate(new_src), np.concatenate(new_dst)
 
         
     def print_edges(self) -> None:
         """
             Print the adjacency matrix with colored edges.
         """
-        n = len(self.A)
+        A = self.A.to_dense()
+        n = len(A)
         for i in range(n):
             for j in range(0, n):
-                if self.A[i][j] == 1:
-                    print(f"{Fore.GREEN}{self.A[i][j]} ", end='')
+                if A[i][j] == 1:
+                    print(f"{Fore.GREEN}{A[i][j]} ", end='')
                 else:
-                    print(f"{self.A[i][j]} ", end='')
+                    print(f"{A[i][j]} ", end='')
             print()  # New line after each row
 
 
@@ -172,48 +240,59 @@ class Graph:
         """
             Each resident interacts with one of their contacts, if they have any.
             During the interaction the infection can possbily spread.
+            The disease progression, infections and quarantine countdowns are done for all residents at once.
             params: i: int, current timestep
         """
-        A = self.A  
-        n = len(A)
-        # loop through each person and have them interact with one of their contacts
-        for i in range(n):
-
-            # run timestep for person
-            person1 = self._get_person(i)
-            person1.timestep()
+        A = self.A
+        population = self.population
+        profiler = self.profiler
 
-            # get indices of possible contacts for person i
-            idx = np.flatnonzero(A[i])
+        # run timestep for all persons
+        with profiler.phase('progress'):
+            removed = population.progress()
+        with profiler.phase('trace_contacts'):
+            self.app.trace_contacts(removed, i)
+        with profiler.phase('quarantine_countdown'):
+            population.release(removed)  # after removed, no longer quarantined
+            population.count_down_quarantine()
 
-            if idx.size == 0:
-                # no contacts for this person, go to next person
-                continue
+        # every person interacts with one random contact, drawn for all persons at once
+        with profiler.phase('sample_contacts'):
+            persons1, persons2 = A.sample_neighbours(self.contact_rng, self._active_persons())
 
+        # update history of both persons if both use the app
+        with profiler.phase('log_contacts'):
+            self.app.log_contacts(persons1, persons2, i)
 
-            # get index of a random contact
-            interaction = random.choice(idx)
+        # interaction logic, if one of both is infected the other can get infected
+        with profiler.phase('infect'):
+            infected1 = population.state[persons1] == INFECTED
+            infected2 = population.state[persons2] == INFECTED
+            population.infect(np.concatenate((persons2[infected1], persons1[~infected1 & infected2])))
 
-            # interaction logic
-            
-            person2 = self._get_person(interaction)
+        self._record_history()
 
-            # update history of both persons
-            self.app.update_app(person1, person2, i)
-            self.app.update_app(person2, person1, i)
 
-            # print(f"Interaction between {person1.name} and {person2.name}")
+    def _active_persons(self) -> np.ndarray:
+        """
+            Persons that draw a contact today, None for everyone.
+            An interaction only matters if it can spread the infection or is logged by the app. With the active
+            frontier all other interactions are left out by only drawing contacts for infected persons, their
+            contacts and app users.
+        """
+        if not self.active_frontier:
+            return None
+        infected = self.population.infected
+        return np.union1d(np.union1d(infected, self.A.neighbours_of(infected)), self.app_users)
 
-            if (person1.infection_status == 'Infected'):
-                person2.infect()
-            elif (person2.infection_status == 'Infected'):
-                person1.infect()
 
+    def _record_history(self) -> None:
         n_infected, n_exposed, n_removed, n_susceptible = self.count_n_infections()
         self.history_I.append(n_infected)
         self.history_E.append(n_exposed)
         self.history_R.append(n_removed)
         self.history_S.append(n_susceptible)
+        self.history_Q.append(self.population.n_quarantined)
 
         #self.print_n_infections(n_infected, n_exposed, n_removed, n_susceptible)
 
@@ -223,106 +302,142 @@ class Graph:
             Quarantine a person by setting their quarantined status to True.
             params: person: Person, the person to quarantine
         """
+        self.quarantine_people(np.array([person.index]))
 
-        def self_test(person: Person) -> bool:
-            """
-                Returns result of self test with probavility of false positive of false negative.
-                returns: bool, True if test is positive, False otherwise
-            """
 
-            # 8,16% false negative rate
-            if person.infection_status == 'Infected':
-                return random.random() > 0.0816
-            
-            # 0.05% false positive rate
-            return random.random() < 0.0005
+    def quarantine_people(self, indices: np.ndarray, times_logged: np.ndarray = None) -> None:
+        """
+            Quarantine all notified persons at once. With self testing only the persons that test positive
+            go into quarantine, the test has a false negative rate of 8.16% and a false positive rate of 0.05%.
+            params: indices: np.ndarray, indices of the persons to quarantine
+                    times_logged: np.ndarray, number of logged contacts each person was notified through, every
+                                  one of them is a separate chance to be notified and to test, see App_controller.trace_contacts
+        """
+        state = self.population.state[indices]
 
         if self.include_self_test:
-            if self_test(person):
-                person.quarantined = True
-
-                # check whether a person is correctly quarantined in history
-                if person.infection_status == 'Infected' or person.infection_status == 'Exposed':
-                    self.history_quarantined.append(1)
-                else:
-                    self.history_quarantined.append(0)
-        
+            u = uniform(self.app.rng, indices)
+            positive = np.where(state == INFECTED, u > 0.0816, u < 0.0005)
+            if times_logged is not None and np.any(times_logged > 1):
+                # each of the m logged contacts notifies with probability q and is followed by its own test,
+                # so a person quarantines with probability 1 - (1 - q * p)^m for a positive test chance p,
+                # given that the person was notified at least once, which has probability 1 - (1 - q)^m
+                many = times_logged > 1
+                m, q = times_logged[many], self.app.quarantine_probability
+                p = np.where(state[many] == INFECTED, 1 - 0.0816, 0.0005)
+                positive[many] = u[many] < (1 - (1 - q * p) ** m) / (1 - (1 - q) ** m)
         else:
-            person.quarantined = True
-            # check whether a person is correctly quarantined in history
-            if person.infection_status == 'Infected' or person.infection_status == 'Exposed':
-                self.history_quarantined.append(1)
-            else:
-                self.history_quarantined.append(0)
+            positive = np.ones(len(indices), dtype=bool)
 
+        self.population.quarantine(indices[positive])
 
-    def remove_quarantined(self) -> None:
+        # log whether a person is correctly quarantined
+        self._log_quarantine_events(indices, (state == INFECTED) | (state == EXPOSED), positive)
+
+
+    def _log_quarantine_events(self, indices: np.ndarray, was_infected: np.ndarray, passed_self_test: np.ndarray) -> None:
+        end = self.n_quarantine_events + len(indices)
+        if end > len(self.quarantine_log):
+            grown = np.empty(max(end, 2 * len(self.quarantine_log)), dtype=QUARANTINE_EVENT_DTYPE)
+            grown[:self.n_quarantine_events] = self.quarantine_log[:self.n_quarantine_events]
+            self.quarantine_log = grown
+        events = self.quarantine_log[self.n_quarantine_events:end]
+        events['day'] = self.population.day
+        events['person'] = indices
+        events['was_infected'] = was_infected
+        events['passed_self_test'] = passed_self_test
+        self.n_quarantine_events = end
+
+
+    @property
+    def quarantine_events(self) -> np.ndarray:
         """
-            Remove all quarantined individuals from the adjancy matrix such that no interaction will be made with those persons.
+            returns: np.ndarray of QUARANTINE_EVENT_DTYPE records, every notification of the app so far
         """
-        # Find indices of quarantined individuals
-        quarantined_indices = [i for i, person in enumerate(self.nodes) if person.quarantined]
+        return self.quarantine_log[:self.n_quarantine_events]
+
 
-        if not quarantined_indices:
-            return  # No one is quarantined, nothing to do
+    @property
+    def history_quarantined(self) -> np.ndarray:
+        """
+            returns: np.ndarray, 1 for every quarantine of an Exposed or Infected person and 0 for a healthy one
+        """
+        events = self.quarantine_events
+        return events['was_infected'][events['passed_self_test']].astype(np.int8)
 
-        # Zero out their rows and columns in the adjacency matrix
-        for idx in quarantined_indices:
-            self.A[idx, :] = 0  # Zero out the entire row
-            self.A[:, idx] = 0  # Zero out the entire column
+
+    def remove_quarantined(self) -> None:
+        """
+            Remove all quarantined individuals from the adjacency structure such that no interaction will be made with those persons.
+            The adjacency structure uses the quarantined array of the population as its removal mask, so people
+            are left out as soon as they are quarantined and come back when their quarantine ends.
+        """
+        self.A.removed = self.population.quarantined
                 
                 
     def count_n_infections(self):
-        n_infected = sum(1 for person in self.nodes if person.infection_status == 'Infected')
-        n_exposed = sum(1 for person in self.nodes if person.infection_status == 'Exposed')
-        n_removed = sum(1 for person in self.nodes if person.infection_status == 'Removed')
-        n_susceptible = sum(1 for person in self.nodes if person.infection_status == 'Susceptible')
-        return n_infected, n_exposed, n_removed, n_susceptible
+        counts = self.population.counts
+        return int(counts[INFECTED]), int(counts[EXPOSED]), int(counts[REMOVED]), int(counts[SUSCEPTIBLE])
     
 
     def print_n_infections(self, n_infected, n_exposed, n_removed, n_susceptible):
         """
             Print the total number of infections.
         """
-        n_quarantined = sum(1 for person in self.nodes if person.quarantined)
+        n_quarantined = self.population.n_quarantined
         print(f"Total Infected: {n_infected}, Exposed: {n_exposed}, Removed: {n_removed}, Susceptible: {n_susceptible}, Quarantined: {n_quarantined}")
 
 
     def make_neighbourhood_contacts(self, percentage: int) -> None:
         """
-            Create contacts for each neighbourhood based on the adjacency matrix.
+            Create contacts for each neighbourhood based on the adjacency structure.
             Each person in a neighbourhood will have contacts with people in the same neighbourhood
             as well as people in connected neighbourhoods.
             params: percentage: int, percentage of residents in connected neighbourhoods to be added as contacts
         """
 
-        n = len(self.nodes)
+        n = len(self.population)
+        n_outside = n - self.number_residents
+        if n_outside == 0:
+            return  # only one neighbourhood, nobody to meet outside of it
 
         # Get indices of residents to add contacts for
-        indices = random.sample(range(n), int(n * (percentage / 100)))
+        indices = self.contact_rng.choice(n, int(n * (percentage / 100)), replace=False).tolist()
 
         for i in indices:
             
             # Get the neighbourhood of the person
             neighbourhood_index = i // self.number_residents
+            block_start = neighbourhood_index * self.number_residents
             
-            # Find possible contacts in other neighbourhoods
-            possible_contacts = [j for j in range(n) if self.A[i][j] == 0 and not self._is_in_neighbourhood(neighbourhood_index, j)]
-            new_contact = random.choice(possible_contacts)
+            # Pick a random person in another neighbourhood by skipping over the own block of residents,
+            # and draw again if this person is already a contact. This gives the same uniform choice
+            # over all possible contacts at O(1) expected cost.
+            new_contact = self._draw_outside_neighbourhood(block_start, n_outside)
+            while self.A.has_edge(i, new_contact):
+                new_contact = self._draw_outside_neighbourhood(block_start, n_outside)
 
-            # Add new egdes to adjacency matrix
-            self.A[i][new_contact] = 1
-            self.A[new_contact][i] = 1
+            # Add new egdes to adjacency structure
+            self.A.add_edge(i, new_contact)
 
    
     def delete_neighbourhood_contacts(self) -> None:
         """
-            Remove all contacts between different neighbourhoods by resetting the adjacency matrix to its original state.
-            This ensures that only intra-neighbourhood contacts remain.
+            Remove all contacts between different neighbourhoods by clearing the overlay of the adjacency structure.
+            This ensures that only intra-neighbourhood contacts remain, and costs O(1) instead of copying the network.
         """
-        self.A = copy.deepcopy(self.copyA)
-        if self.include_quarantining:
-            self.remove_quarantined()
+        self.A.clear_overlay()
+
+
+    def _draw_outside_neighbourhood(self, block_start: int, n_outside: int) -> int:
+        """
+            Draw a uniformly random person that does not live in the neighbourhood starting at block_start.
+            params: block_start: int, index of the first resident of the neighbourhood
+                    n_outside: int, number of persons outside of the neighbourhood
+            returns: int, index of the drawn person
+        """
+        j = int(self.contact_rng.integers(n_outside))
+        return j + self.number_residents if j >= block_start else j
 
 
     def _is_in_neighbourhood(self, neighbourhood_index: int, person_index: int) -> bool:
@@ -344,7 +459,7 @@ class Graph:
     
 
     def _get_infected_ids(self) -> list[int]:
-        return [i for i in range(len(self.nodes)) if self.nodes[i].infection_status == "Infected"]
+        return np.flatnonzero(self.population.state == INFECTED).tolist()
     
 
     def _fix_node_positions(self) -> dict:
@@ -358,9 +473,9 @@ class Graph:
             nodes = list(range(start, end))
             G_neighbourhood = nx.Graph()
             for u in nodes:
-                for v in nodes:
-                    if self.A[u][v] == 1:
-                        G_neighbourhood.add_edge(u, v)
+                for v in self.A.neighbours(u):
+                    if start <= v < end:
+                        G_neighbourhood.add_edge(u, int(v))
             neighbourhood_pos = nx.spring_layout(G_neighbourhood, seed=i)
 
             between_x = (i % cols) * space_between_nodes
@@ -384,7 +499,7 @@ class Graph:
 
     def plot_history(self, history_E, history_I, history_S, history_R):
         days = list(range(1, len(self.history_I) + 1))
-        plot_data(days, history_E, history_I, history_S, history_R, len(self.nodes))
+        plot_data(days, history_E, history_I, history_S, history_R, len(self.population))
 
 
     def plot_quarantained(self, quarantined_history):
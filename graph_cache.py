@@ -0,0 +1,103 @@
+import os
+import shutil
+import time
+from adjacency import Adjacency
+from graph import Graph, NETWORK_VERSION
+
+CACHE_FOLDER = os.path.join("results", "graph_cache")
+NETWORK_PARAMS = ('number_neighbourhoods', 'number_residents', 'num_connections', 'rewire_prob')
+
+
+class GraphCache:
+    def __init__(self, folder: str = CACHE_FOLDER, max_mb: float = 1024, max_age_days: float = 30):
+        """
+            On-disk cache of contact networks, keyed by the parameters that build a network, its seed and the
+            NETWORK_VERSION of Graph.build_network.
+            Every network is a directory written by Adjacency.save, which is loaded as read-only memory maps,
+            so a cached network loads in milliseconds and is shared by all processes that use it.
+            The modification time of a network is its last use. After a network is added, networks that were
+            not used for max_age_days days are removed, and then the least recently used networks until the
+            cache is at most max_mb large.
+            params: folder: str, directory of the cache
+                    max_mb: float, maximum size of the cache in MB, 0 for no limit
+                    max_age_days: float, maximum number of days since the last use of a network, 0 for no limit
+        """
+        self.folder = folder
+        self.max_mb = max_mb
+        self.max_age_days = max_age_days
+
+
+    def path(self, number_neighbourhoods: int, number_residents: int, num_connections: int,
+             rewire_prob: float, seed: int) -> str:
+        """
+            returns: str, directory of the network with these parameters, built by the current version of
+                     Graph.build_network, networks of older versions are never loaded and age out of the cache
+        """
+        return os.path.join(self.folder, f"network_v{NETWORK_VERSION}_{number_neighbourhoods}x{number_residents}"
+                                         f"_k={num_connections}_p={rewire_prob!r}_seed={seed}")
+
+
+    def get(self, number_neighbourhoods: int, number_residents: int, num_connections: int,
+            rewire_prob: float, seed: int) -> Adjacency:
+        """
+            Load the network with these parameters from the cache, it is built with Graph.build_network and
+            added when it is not in the cache. A network without a seed is random and is never cached.
+            returns: Adjacency
+        """
+        args = (number_neighbourhoods, number_residents, num_connections, rewire_prob, seed)
+        if seed is None:
+            return Graph.build_network(*args)
+        path = self.path(*args)
+        if os.path.isdir(path):
+            os.utime(path)
+        else:
+            # other processes can build the same network at the same time, the first one to move it in place wins
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            Graph.build_network(*args).save(tmp_path)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            self.evict(keep=path)
+        return Adjacency.load(path)
+
+
+    def with_network(self, graph_params: dict) -> dict:
+        """
+            Return graph_params with the cached network of its network_seed as its adjacency.
+            Only networks with a network_seed are shared between runs, without one the network of a run
+            comes from the seed of the run, is used once and is not cached.
+            params: graph_params: dict, keyword arguments of Graph
+        """
+        if graph_params.get('adjacency') is not None or graph_params.get('network_seed') is None:
+            return graph_params
+        adjacency = self.get(*(graph_params[name] for name in NETWORK_PARAMS), graph_params['network_seed'])
+        return dict(graph_params, adjacency=adjacency)
+
+
+    def evict(self, keep: str = None) -> None:
+        """
+            Remove networks that were not used for too long and then the least recently used ones until
+            the cache is small enough. Networks that are still mapped by a run stay readable until it ends.
+            params: keep: str, directory of a network that is never removed, e.g. the one just added
+        """
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if '.tmp' in name or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except FileNotFoundError:
+                continue  # removed by another process
+        entries.sort()  # least recently used first
+
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for last_used, size, path in entries:
+            too_old = self.max_age_days and now - last_used > self.max_age_days * 86400
+            too_large = self.max_mb and total > self.max_mb * 2**20
+            if path != keep and (too_old or too_large):
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
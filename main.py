@@ -1,15 +1,19 @@
-from graph import Graph
 import configparser
 from plot_initial_graph import plot_graph
-import numpy as np
 from datetime import datetime
+import json
 import os
+import numpy as np
+from runner import run_jobs, job_seed
+from results_store import ResultsWriter, confidence_half_widths, load_summary
+from checkpoint import SweepManifest
+from graph_cache import GraphCache
 
 if __name__ == "__main__":
 
     # Read configuration parameters
     config = configparser.ConfigParser()
-    config.read('config.ini')   
+    config.read('config.ini')
     num_neighbourhoods = config.getint('Parameters', 'number_of_neighbourhoods', fallback=3)
     residents_per_neighbourhood = config.getint('Parameters', 'residents_per_neighbourhood', fallback=10)
     num_connection = config.getint('Parameters', 'number_of_connections', fallback=4)
@@ -17,21 +21,54 @@ if __name__ == "__main__":
     percentage_neighbourhood_contacts = config.getfloat('Parameters', 'percentage_neighbourhood_contacts', fallback=1)
     include_quarantining = config.getboolean('Parameters', 'include_quarantining', fallback=True)
     include_self_test = config.getboolean('Parameters', 'include_self_test', fallback=False)
+    event_driven = config.getboolean('Parameters', 'event_driven', fallback=False)
+    active_frontier = config.getboolean('Parameters', 'active_frontier', fallback=False)
+    seed = config.getint('Parameters', 'seed', fallback=0)
+    num_workers = config.getint('Parameters', 'number_of_workers', fallback=0)  # 0 uses all cores
+    checkpoint_every = config.getint('Parameters', 'checkpoint_every', fallback=0)  # days between checkpoints, 0 disables them
+    profile = config.getboolean('Parameters', 'profile', fallback=False)  # time the phases of every day of every run
+    profile_memory = config.getboolean('Parameters', 'profile_memory', fallback=False)
+    adaptive_runs = config.getboolean('Parameters', 'adaptive_runs', fallback=False)  # stop a cell once its results are precise enough
+    min_runs = config.getint('Parameters', 'min_runs', fallback=10)  # runs per round with adaptive runs
+    ci_half_width = config.getfloat('Parameters', 'ci_half_width', fallback=0.01)  # target half width of the 95% intervals
+    batch_size = config.getint('Parameters', 'batch_size', fallback=0)  # runs per batch advanced in lockstep, 0 runs them one by one
+    shared_network = config.getboolean('Parameters', 'shared_network', fallback=False)  # one contact network for all runs
+    use_graph_cache = config.getboolean('Parameters', 'graph_cache', fallback=True)  # load networks built before from disk
+    graph_cache_max_mb = config.getfloat('Parameters', 'graph_cache_max_mb', fallback=1024)
+    graph_cache_max_age_days = config.getfloat('Parameters', 'graph_cache_max_age_days', fallback=30)
 
     pos_app_usage_rate = [0.75]
     pos_quar_prob_rate = [0, 0.25, 0.5, 0.75, 1]
     # app_usage_rate = config.getfloat('Parameters', 'app_usage_rate', fallback=1.0)
     # quarantine_probability = config.getfloat('Parameters', 'quarantine_probability', fallback=0.5)
 
-    for app_usage_rate in pos_app_usage_rate:
-        for quar_prob_rate in pos_quar_prob_rate:
-            history_I, history_E, history_S, history_R, history_quarantaine = [], [], [], [], []
-
-            T = 50  # number of simulation runs
-            for i in range(T):
-                print(f"Simulation run {i+1}/{T}")
-                # initialize graph
-                graph = Graph(number_neighbourhoods=num_neighbourhoods, 
+    T = 50  # number of simulation runs, the maximum number with adaptive runs
+    num_days = 210
+    run_params = dict(num_days=num_days, percentage_neighbourhood_contacts=percentage_neighbourhood_contacts)
+
+    # one job per (parameter cell, simulation run), every job gets its own seed
+    # runs that are already stored by an earlier, interrupted sweep with the same configuration are skipped
+    manifest = SweepManifest("results")
+
+    # networks that are shared between runs are loaded from the cache when they were built before, by this
+    # or an earlier sweep, the network of a run without a network_seed is only used once and never cached
+    graph_cache = GraphCache(max_mb=graph_cache_max_mb, max_age_days=graph_cache_max_age_days) if use_graph_cache else None
+
+    # with a shared network the contact network is built once from the sweep seed, every run maps
+    # the same read-only files, so only the epidemic differs between the runs
+    network_params = {}
+    adjacency = None
+    if shared_network:
+        network_params = dict(network_seed=seed)
+        # the network is mapped from its file in the cache, which is not evicted when the cache is disabled
+        adjacency = (graph_cache or GraphCache(max_mb=0, max_age_days=0)).get(
+            num_neighbourhoods, residents_per_neighbourhood, num_connection, rewire_prob, seed)
+    cells = [(app_usage_rate, quar_prob_rate) for app_usage_rate in pos_app_usage_rate for quar_prob_rate in pos_quar_prob_rate]
+    store_paths = []
+    cell_params = []
+    cell_keys = []
+    for cell, (app_usage_rate, quar_prob_rate) in enumerate(cells):
+        graph_params = dict(number_neighbourhoods=num_neighbourhoods,
                             number_residents=residents_per_neighbourhood,
                             num_connections=num_connection,
                             careless_prob=0.05,
@@ -39,76 +76,73 @@ if __name__ == "__main__":
                             include_quarantining=include_quarantining,
                             app_usage_rate=app_usage_rate,
                             quarantine_probability=quar_prob_rate,
-                            include_self_test=include_self_test
+                            include_self_test=include_self_test,
+                            event_driven=event_driven,
+                            active_frontier=active_frontier,
+                            **network_params
                             )
-                
-                edge_graphs = []
-                #pos, x_max, y_max = graph._fix_node_positions()
-
-                for i in range(210):
-                    #print(f"\nTimestep {i+1}\n")
-
-                    graph.make_neighbourhood_contacts(percentage=percentage_neighbourhood_contacts)
-
-                    
-                    if i % 5 == 0:
-                        edge_graph = graph.A.copy()
-                        infected_ids = graph._get_infected_ids()
-                        edge_graphs.append((edge_graph, infected_ids))
-                        
-
-                    graph.timestep(i=i)
-                    
-                    graph.delete_neighbourhood_contacts()
-
-                    if graph.history_E[-1] == 0 and graph.history_I[-1] == 0:
-                        print(f"Simulation ended early at day {i+1} as there are no more Exposed or Infected individuals.")
-                        for _ in range(i+1, 210):
-                            graph.history_E.append(0)
-                            graph.history_I.append(0)
-                            graph.history_S.append(graph.history_S[-1])
-                            graph.history_R.append(graph.history_R[-1])
-                            if len(graph.history_quarantined) > 0:
-                                graph.history_quarantined.append(graph.history_quarantined[-1])
-                        break
-
-                # uncomment to plot graphs at each 6th timestep
-                #for idx, g in enumerate(edge_graphs):
-                #    plot_graph(*g, (idx*5) + 1, pos)
-                history_I.append(graph.history_I)
-                history_E.append(graph.history_E)
-                history_S.append(graph.history_S)
-                history_R.append(graph.history_R)
-
-                history_quarantaine.append(graph.history_quarantined)
-
-            # Determine number of simulated days
-            num_days = len(graph.history_I)
-            print(num_days)
-            filename = f"simulation_results_Q={quar_prob_rate}A={app_usage_rate}_selftest={include_self_test}{datetime.now():%Y%m%d_%H%M%S}.npz"
-            dirname= "results"
-
-            # pad history_quarantaine to have same length arrays
-            history_quarantaine = np.array([x + [-1]*(max(map(len, history_quarantaine)) - len(x)) 
-                                            for x in history_quarantaine])
-            
-            # Save all results to file
-            np.savez(
-                os.path.join(dirname, filename),
-                history_E=history_E,
-                history_I=history_I,
-                history_S=history_S,
-                history_R=history_R,
-                history_quarantaine=history_quarantaine,
-                num_days=num_days,
-                n_total=len(graph.nodes)
-            )
-
-            # Uncomment to plot results
-            # graph.plot_history(history_E, history_I, history_S, history_R)
-            # graph.plot_quarantained(history_quarantaine)
-
-
-
-
-        
\ No newline at end of file
+        cell_params.append(graph_params)
+        # the batched engine draws its random numbers in another order, so its runs are stored separately
+        key = json.dumps(dict(graph_params, **run_params, seed=seed, **({'batched': True} if batch_size else {})), sort_keys=True)
+        dirname = f"simulation_results_Q={quar_prob_rate}A={app_usage_rate}_selftest={include_self_test}{datetime.now():%Y%m%d_%H%M%S}"
+        store_paths.append(manifest.store_path(key, os.path.join("results", dirname)))
+        cell_keys.append(key)
+
+    # the runs are done in rounds, without adaptive runs every cell gets its T runs in a single round.
+    # With adaptive runs every cell starts with min_runs runs and gets min_runs more each round, until the
+    # confidence intervals of its metrics are narrow enough or it has T runs. The runs of a cell are always
+    # the first runs of the fixed sequence of seeds of the cell, so the result does not depend on the workers.
+    planned = {cell: min(min_runs, T) if adaptive_runs else T for cell in range(len(cells))}
+    started = dict.fromkeys(planned, 0)
+    writers = {}
+    while planned:
+        jobs = []
+        n_round = 0
+        for cell, n_runs in planned.items():
+            completed = manifest.completed(cell_keys[cell])
+            todo = [(i, job_seed(seed, cell, i)) for i in range(started[cell], n_runs) if job_seed(seed, cell, i) not in completed]
+            n_round += n_runs - started[cell]
+            started[cell] = n_runs
+            if batch_size:
+                # every batch is one job, identified by its first run
+                todo = [([i for i, _ in todo[k:k + batch_size]], [s for _, s in todo[k:k + batch_size]])
+                        for k in range(0, len(todo), batch_size)]
+            for i, run_seed in todo:
+                checkpoint_path = os.path.join(store_paths[cell], "checkpoints", f"run_{i[0] if batch_size else i}.pkl")
+                job_params = dict(cell_params[cell], adjacency=adjacency) if shared_network else cell_params[cell]
+                jobs.append((cell, i, job_params, run_seed,
+                             dict(run_params, checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+                                  profile=profile, profile_memory=profile_memory, graph_cache=graph_cache)))
+        n_todo = sum(len(job[1]) if batch_size else 1 for job in jobs)
+        print(f"{n_round - n_todo} of {n_round} simulation runs are already done")
+
+        # append every run to the store of its cell as soon as it comes in
+        for n_done, (cell, i, run_seed, result) in enumerate(run_jobs(jobs, max_workers=num_workers or None), start=1):
+            print(f"Simulation run {n_done}/{n_todo}")
+            if cell not in writers:
+                writers[cell] = ResultsWriter(store_paths[cell], num_days=num_days, n_total=result['n_total'],
+                                              params=cell_params[cell])
+
+            writers[cell].append(i, run_seed, result)
+            if 'profile' in result:
+                os.makedirs(os.path.join(store_paths[cell], "profiles"), exist_ok=True)
+                result['profile'].save(os.path.join(store_paths[cell], "profiles", f"run_{i}.json"))
+
+        # a cell is done when it has T runs or, with adaptive runs, when its confidence intervals are narrow enough
+        for cell in list(planned):
+            if adaptive_runs:
+                summary = load_summary(store_paths[cell])
+                half_widths = confidence_half_widths(summary)
+                converged = max(half_widths.values(), default=np.inf) <= ci_half_width
+                if not converged and planned[cell] < T:
+                    planned[cell] = min(planned[cell] + min_runs, T)
+                    continue
+                print(f"Cell Q={cells[cell][1]} A={cells[cell][0]} {'converged' if converged else 'did not converge'} "
+                      f"after {int(summary['n_runs'])} runs: " + ", ".join(f"{name} +/-{width:.4f}" for name, width in half_widths.items()))
+            del planned[cell]
+            if cell in writers:
+                writers.pop(cell).close()
+
+        # Uncomment to plot results
+        # graph.plot_history(history_E, history_I, history_S, history_R)
+        # graph.plot_quarantained(history_quarantaine)
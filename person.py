@@ -1,34 +1,113 @@
-import random
 import math
+from collections.abc import Sequence
+import numpy as np
 from app_controller import App_controller
+from population import Population, STATE_NAMES, STATE_CODES
+
 
 class Person:
-    def __init__(self, name, app: App_controller):
+    __slots__ = ('name', 'app', 'population', 'index')
+
+    def __init__(self, name, app: App_controller, population: Population = None, index: int = 0):
+        """
+            Thin view on one person in a Population, all state lives in the population arrays.
+            A person created without a population gets a population of its own.
+            params: name: str, name of the person
+                    app: App_controller, app used for contact tracing
+                    population: Population, store holding the state of this person
+                    index: int, index of this person in the population
+        """
         self.name = name
-        self.infection_status = 'Susceptible'
-        self.total_days = 0
-        self.days_exposed = 0
-        self.days_infected = 0
-        self.quarantined = False
-        self.days_quarantined = 0
-        self.careless = False
         self.app = app
-    
+        self.population = population if population is not None else Population(1)
+        self.index = index
+
+
+    def __eq__(self, other):
+        return isinstance(other, Person) and self.population is other.population and self.index == other.index
+
+
+    def __hash__(self):
+        return hash((id(self.population), self.index))
+
+
+    @property
+    def infection_status(self) -> str:
+        return STATE_NAMES[self.population.state[self.index]]
+
+    @infection_status.setter
+    def infection_status(self, status: str):
+        self.population.set_state(np.array([self.index]), STATE_CODES[status])
+
+    @property
+    def total_days(self) -> int:
+        return int(self.population.total_days[self.index])
+
+    @total_days.setter
+    def total_days(self, value: int):
+        self.population.total_days[self.index] = value
+
+    @property
+    def days_exposed(self) -> int:
+        return int(self.population.days_exposed[self.index])
+
+    @days_exposed.setter
+    def days_exposed(self, value: int):
+        self.population.days_exposed[self.index] = value
+
+    @property
+    def days_infected(self) -> int:
+        return int(self.population.days_infected[self.index])
+
+    @days_infected.setter
+    def days_infected(self, value: int):
+        self.population.days_infected[self.index] = value
+
+    @property
+    def quarantined(self) -> bool:
+        return bool(self.population.quarantined[self.index])
+
+    @quarantined.setter
+    def quarantined(self, value: bool):
+        if value:
+            self.population.quarantine(np.array([self.index]))
+        else:
+            self.population.release(np.array([self.index]))
+
+    @property
+    def days_quarantined(self) -> int:
+        return int(self.population.days_quarantined[self.index])
+
+    @days_quarantined.setter
+    def days_quarantined(self, value: int):
+        self.population.days_quarantined[self.index] = value
+
+    @property
+    def careless(self) -> bool:
+        return bool(self.population.careless[self.index])
+
+    @careless.setter
+    def careless(self, value: bool):
+        self.population.careless[self.index] = value
+
 
     def timestep(self):
+        """
+            Single person version of Population.progress and Population.count_down_quarantine.
+        """
         self.total_days += 1
         if self.infection_status == 'Susceptible':  # nothing happens if healthy
             pass
         elif self.infection_status == 'Exposed':    # after 6 days of being infected, become exposed
             self.days_exposed += 1
             p = math.exp(2 * (self.days_exposed - 3.2))   # exponential growth, ~100% by day 4 as per paper
-            if random.random() < p:
+            if self.population.rng.random() < p:
                 self.infection_status = 'Infected'
                 self.days_exposed = 0
         elif self.infection_status == 'Infected':   # after 6 days of being exposed, become removed
             self.days_infected += 1
             p = math.exp(2 * (self.days_infected - 3.2))       # same exponential form
-            if random.random() < p:
+            if self.population.rng.random() < p:
                 self.infection_status = 'Removed'
                 self.days_infected = 0
                 if self.app:
@@ -39,18 +118,54 @@ class Person:
             if self.days_quarantined >= 8: # after 8 days, someone would not be Exposed or Infected anymore
                 self.quarantined = False
                 self.days_quarantined = 0
-            
+
 
     def infect(self):
         """
             Determines whether a susceptible individual becomes exposed (infected but not yet infectious)
-            after contact with an infected individual. The infection does not occur deterministically; 
-            instead, it happens with a fixed probability (e.g., 3% for normal individuals or 15% for 
+            after contact with an infected individual. The infection does not occur deterministically;
+            instead, it happens with a fixed probability (e.g., 3% for normal individuals or 15% for
             careless individuals). This reflects the chance-based nature of transmission in the model.
         """
         if self.infection_status == 'Susceptible':
             infection_chance = 0.8 if self.careless else 0.45
-            if random.random() < infection_chance:
+            if self.population.rng.random() < infection_chance:
                 self.infection_status = 'Exposed'
                 self.days_exposed = 0
-                # print(f"{self.name} has been exposed!")
\ No newline at end of file
+                # print(f"{self.name} has been exposed!")
+
+
+class Persons(Sequence):
+    __slots__ = ('population', 'app', 'number_residents', 'start', 'stop')
+
+    def __init__(self, population: Population, app: App_controller, number_residents: int,
+                 start: int = 0, stop: int = None):
+        """
+            Sequence of the persons start ... stop - 1 of a population, the Person views are only created
+            when they are accessed, so a graph of any size is set up without creating a Person per person.
+            params: population: Population, store holding the state of the persons
+                    app: App_controller, app used for contact tracing
+                    number_residents: int, number of residents per neighbourhood, used to name the persons
+                    start, stop: int, range of population indices in the sequence, the whole population by default
+        """
+        self.population = population
+        self.app = app
+        self.number_residents = number_residents
+        self.start = start
+        self.stop = len(population) if stop is None else stop
+
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("person index out of range")
+        index = self.start + i
+        return Person(name=f"({index % self.number_residents}, {index // self.number_residents})", app=self.app,
+                      population=self.population, index=index)
@@ -2,7 +2,12 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 
-def plot_data(x, history_E, history_I, history_S, history_R, n_total, save_path=None):
+def plot_data(x, history_E, history_I, history_S, history_R, n_total, save_path=None, bands=None):
+    """
+        Plot the average number of persons in each state per day.
+        params: history_E, history_I, history_S, history_R: one row per run, or already averaged over the runs
+                bands: dict, optional (lower, upper) quantiles per day of 'history_E' and 'history_I', drawn as a shaded band
+    """
 
     # uncomment to use moving average
     # count moving average with window size 2
@@ -33,16 +38,20 @@ def plot_data(x, history_E, history_I, history_S, history_R, n_total, save_path=
     ]
     '''
 
-    history_E, history_I, history_S, history_R =  np.array(history_E), np.array(history_I), np.array(history_S), np.array(history_R)
-    history_E = history_E.mean(axis=0)
-    history_I = history_I.mean(axis=0)
-    history_S = history_S.mean(axis=0)
-    history_R = history_R.mean(axis=0)
+    history_E, history_I, history_S, history_R =  np.asarray(history_E), np.asarray(history_I), np.asarray(history_S), np.asarray(history_R)
+    if history_E.ndim == 2:
+        history_E = history_E.mean(axis=0)
+        history_I = history_I.mean(axis=0)
+        history_S = history_S.mean(axis=0)
+        history_R = history_R.mean(axis=0)
 
     fig, axs = plt.subplots(2, 1, figsize=(8, 6))  # 2 rows, 1 column
 
     axs[0].plot(x, history_E, color="#ffcc00", label='Exposed [E]')
     axs[0].plot(x, history_I, color="#ff0000", label='Infected [I]')
+    if bands:
+        axs[0].fill_between(x, *bands['history_E'], color="#ffcc00", alpha=0.2, linewidth=0)
+        axs[0].fill_between(x, *bands['history_I'], color="#ff0000", alpha=0.2, linewidth=0)
     axs[0].set_ylabel('Persons')
     axs[0].set_xlabel('Time [Days]')
     axs[0].set_ylim(0, 270)
@@ -71,23 +80,36 @@ def plot_data(x, history_E, history_I, history_S, history_R, n_total, save_path=
 
     if save_path:
         plt.savefig(save_path, dpi=300)
+        plt.close()
     else:
         plt.show()
     
 def plot_quarantained_bar(history_quarantained, save_path=None):
-    infected_means = []
-    non_infected_means = []
-    total_counts = []
+    infected_counts = []
+    non_infected_counts = []
 
     for run in history_quarantained:
         run = np.array(run)
         valid = run[run != -1]  # ignore padding
-        if len(valid) == 0:
-            continue
+        infected_counts.append(np.sum(valid == 1))
+        non_infected_counts.append(np.sum(valid == 0))
+
+    plot_quarantine_composition(infected_counts, non_infected_counts, save_path=save_path)
+
 
-        infected_count = np.sum(valid == 1)
-        non_infected_count = np.sum(valid == 0)
+def plot_quarantine_composition(infected_counts, non_infected_counts, save_path=None):
+    """
+        Plot the average composition of the quarantined population from the number of quarantines
+        of infected and of healthy persons in each run, runs without quarantines are left out.
+    """
+    infected_means = []
+    non_infected_means = []
+    total_counts = []
+
+    for infected_count, non_infected_count in zip(infected_counts, non_infected_counts):
         total = infected_count + non_infected_count
+        if total == 0:
+            continue
 
         infected_means.append(infected_count / total)
         non_infected_means.append(non_infected_count / total)
@@ -128,5 +150,6 @@ def plot_quarantained_bar(history_quarantained, save_path=None):
 
     if save_path:
         plt.savefig(save_path, dpi=300)
+        plt.close()
     else:
         plt.show()
\ No newline at end of file
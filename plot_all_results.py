@@ -1,39 +1,121 @@
+import hashlib
+import json
 import os
 import re
-import numpy as np
-from plot import plot_data, plot_quarantained_bar
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+matplotlib.use("Agg")  # headless backend, figures are only saved to file
+from plot import plot_data, plot_quarantine_composition
+from results_store import load_summary, is_results_store, INDEX_FILE, META_FILE, SUMMARY_QUANTILES, SUMMARY_SUFFIX
 
 folder_path = "results/"
+CACHE_FILE = ".plot_cache.json"
 
-plots_folder = os.path.join(folder_path, "plots2")
-os.makedirs(plots_folder, exist_ok=True)
-
-simulation_files = [f for f in os.listdir(folder_path) if f.endswith(".npz")]
-
-for sim_file in simulation_files:
-    file_path = os.path.join(folder_path, sim_file)
-    data = np.load(file_path, allow_pickle=True)
-    
-    history_E = data["history_E"]
-    history_I = data["history_I"]
-    history_S = data["history_S"]
-    history_R = data["history_R"]
-    history_quarantined = data["history_quarantaine"]
-    num_days = int(data["num_days"])
-    n_total = int(data["n_total"])
-    
-    days = list(range(1, num_days + 1))
-    
+
+def content_hash(file_path: str) -> str:
+    """
+        Hash of everything a plot of the results depends on, the results and the plotting code.
+        For a results store the index and meta data identify the content, as runs are only ever appended.
+        params: file_path: str, .npz archive or results store directory
+        returns: str, hex digest
+    """
+    h = hashlib.sha256()
+    files = [os.path.join(file_path, INDEX_FILE), os.path.join(file_path, META_FILE)] if is_results_store(file_path) else [file_path]
+    files += [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in ("plot.py", "plot_all_results.py")]
+    for name in files:
+        if os.path.exists(name):
+            with open(name, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+    return h.hexdigest()
+
+
+def plot_files(sim_file: str, plots_folder: str) -> tuple:
     # Shorten filename: remove 'simulation_results_' prefix and any datetime digits at the end
     base_name = sim_file.replace("simulation_results_", "")
     base_name = re.sub(r"\d{8}_\d{6}", "", base_name)  # remove date/time like 20251025_152525
     base_name = base_name.replace(".npz", "")
-    
+
     # Optional: replace some parts to make filename shorter, e.g., underscores for clarity
     base_name = base_name.replace("A=", "_A=").replace("Q=", "Q=")  # example tweak
-    
+
     plot_file1 = os.path.join(plots_folder, f"{base_name}_states.png")
     plot_file2 = os.path.join(plots_folder, f"{base_name}_quarantine.png")
-    
-    plot_data(days, history_E, history_I, history_S, history_R, n_total, save_path=plot_file1)
-    plot_quarantained_bar(history_quarantined, save_path=plot_file2)
\ No newline at end of file
+    return plot_file1, plot_file2
+
+
+def render(file_path: str, plot_file1: str, plot_file2: str) -> None:
+    """
+        Render the state and quarantine figures of one results archive or store.
+    """
+    # the figures only need the summary of the runs, which is computed once and saved next to the results
+    summary = load_summary(file_path)
+
+    history_E = summary["history_E_mean"]
+    history_I = summary["history_I_mean"]
+    history_S = summary["history_S_mean"]
+    history_R = summary["history_R_mean"]
+    band = [SUMMARY_QUANTILES.index(0.1), SUMMARY_QUANTILES.index(0.9)]
+    bands = {name: summary[f"{name}_quantiles"][band] for name in ("history_E", "history_I")}
+    num_days = int(summary["num_days"])
+    n_total = int(summary["n_total"])
+
+    days = list(range(1, num_days + 1))
+
+    plot_data(days, history_E, history_I, history_S, history_R, n_total, save_path=plot_file1, bands=bands)
+    plot_quarantine_composition(summary["quarantined_infected"], summary["quarantined_healthy"], save_path=plot_file2)
+
+
+def render_all(folder_path: str, max_workers: int = None) -> None:
+    """
+        Render the figures of every results archive and store in folder_path on a process pool.
+        Archives whose content hash matches the cache in the plots folder, and whose figures exist, are skipped.
+        params: folder_path: str, folder with the results
+                max_workers: int, number of worker processes, defaults to the number of cores
+    """
+    plots_folder = os.path.join(folder_path, "plots2")
+    os.makedirs(plots_folder, exist_ok=True)
+    cache_path = os.path.join(plots_folder, CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    # results are either .npz archives or result store directories
+    simulation_files = [f for f in os.listdir(folder_path)
+                        if (f.endswith(".npz") and not f.endswith(SUMMARY_SUFFIX)) or is_results_store(os.path.join(folder_path, f))]
+
+    todo = {}
+    for sim_file in simulation_files:
+        file_path = os.path.join(folder_path, sim_file)
+        digest = content_hash(file_path)
+        files = plot_files(sim_file, plots_folder)
+        if cache.get(sim_file) == digest and all(os.path.exists(f) for f in files):
+            continue
+        todo[sim_file] = (digest, file_path, files)
+    print(f"Rendering {len(todo)} of {len(simulation_files)} results, the others are unchanged")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = {pool.submit(render, file_path, *files): sim_file for sim_file, (_, file_path, files) in todo.items()}
+        for future in as_completed(futures):
+            sim_file = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                # a broken result does not stop the others, it is not cached so it is tried again next time
+                print(f"Failed to render {sim_file}: {type(e).__name__}: {e}")
+                failed.append(sim_file)
+                continue
+            cache[sim_file] = todo[sim_file][0]
+            # write the cache after every archive, so an interrupted batch keeps what was rendered
+            with open(cache_path + ".tmp", "w") as f:
+                json.dump(cache, f, indent=2)
+            os.replace(cache_path + ".tmp", cache_path)
+    if failed:
+        print(f"{len(failed)} of {len(todo)} results failed to render")
+
+
+if __name__ == "__main__":
+    render_all(folder_path, max_workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -3,8 +3,10 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 
-def plot_graph(adjacency_matrix, infected_indices, timestep, pos):
-    G = nx.from_numpy_array(np.array(adjacency_matrix))
+def plot_graph(adjacency, infected_indices, timestep, pos):
+    G = nx.Graph()
+    G.add_nodes_from(range(len(adjacency)))
+    G.add_edges_from(adjacency.edges())
 
     plt.figure(figsize=(10, 8))
     colors = ['red' if i in infected_indices else 'lightblue' for i in range(len(G.nodes))]
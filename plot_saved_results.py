@@ -1,8 +1,8 @@
-import numpy as np
 from plot import plot_data, plot_quarantained_bar
+from results_store import load_results
 
-# Load saved results
-data = np.load("10_run_test.npz", allow_pickle=True)
+# Load saved results, either an .npz archive or a result store directory
+data = load_results("10_run_test.npz")
 history_E = data["history_E"]
 history_I = data["history_I"]
 history_S = data["history_S"]
@@ -0,0 +1,209 @@
+import numpy as np
+from streams import uniform
+
+# Infection states are stored as int8 codes, the names are kept for the Person view and printing
+SUSCEPTIBLE, EXPOSED, INFECTED, REMOVED = 0, 1, 2, 3
+STATE_NAMES = ('Susceptible', 'Exposed', 'Infected', 'Removed')
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+QUARANTINE_DAYS = 8  # after 8 days someone would not be Exposed or Infected anymore
+
+# one record per notification of the app, passed_self_test is True when the person went into quarantine
+QUARANTINE_EVENT_DTYPE = np.dtype([('day', np.int16), ('person', np.int32),
+                                   ('was_infected', np.bool_), ('passed_self_test', np.bool_)])
+
+
+def _transition_delay_cdf() -> np.ndarray:
+    """
+        Cumulative distribution of the number of days until the next transition E -> I or I -> R,
+        when the probability to move on after d days is exp(2 * (d - 3.2)).
+        returns: np.ndarray, cdf[d - 1] = probability to move on within d days
+    """
+    hazard = []
+    while not hazard or hazard[-1] < 1:
+        hazard.append(min(1.0, np.exp(2 * (len(hazard) + 1 - 3.2))))
+    hazard = np.array(hazard)
+    survival = np.concatenate(([1.0], np.cumprod(1 - hazard)[:-1]))
+    return np.cumsum(survival * hazard)
+
+
+TRANSITION_DELAY_CDF = _transition_delay_cdf()
+
+
+class Population:
+    def __init__(self, n: int, rng: np.random.Generator = None, event_driven: bool = False):
+        """
+            Struct-of-arrays store holding the state of every person in the graph.
+            Person objects are thin views on one index of these arrays.
+            In event driven mode the day of the next disease transition is drawn as soon as someone becomes
+            Exposed or Infected, and the end of a quarantine is scheduled when it starts. Each day then only
+            touches the persons with an event on that day. The per person day counters (total_days,
+            days_exposed, days_infected and days_quarantined) are not kept up to date in this mode.
+            params: n: int, number of persons
+                    rng: np.random.Generator, random stream for the disease progression and infections
+                    event_driven: bool, whether to use the event driven engine
+        """
+        self.n = n
+        self.rng = rng if rng is not None else np.random.default_rng()  # Generator, or ReplicateStreams for a batch of replicates
+        self.event_driven = event_driven
+        self.day = 0
+        self.state = np.full(n, SUSCEPTIBLE, dtype=np.int8)
+        self.total_days = np.zeros(n, dtype=np.int32)
+        self.days_exposed = np.zeros(n, dtype=np.int16)
+        self.days_infected = np.zeros(n, dtype=np.int16)
+        self.quarantined = np.zeros(n, dtype=bool)
+        self.days_quarantined = np.zeros(n, dtype=np.int16)
+        self.careless = np.zeros(n, dtype=bool)
+        self.app = np.zeros(n, dtype=bool)
+
+        # number of persons per state and in quarantine, kept up to date on every transition
+        self.counts = np.zeros(len(STATE_NAMES), dtype=np.int64)
+        self.counts[SUSCEPTIBLE] = n
+        self.n_quarantined = 0
+        self.infected = np.empty(0, dtype=np.int64)  # sorted indices of all Infected persons
+
+        # event calendars, mapping a day to the arrays of persons with an event on that day
+        self.transition_day = np.full(n, -1, dtype=np.int32)
+        self.release_day = np.full(n, -1, dtype=np.int32)
+        self.transitions = {}
+        self.releases = {}
+
+
+    def __len__(self) -> int:
+        return self.n
+
+
+    def progress(self) -> np.ndarray:
+        """
+            Advance the disease of every person by one day (S -> E -> I -> R).
+            A person makes at most one transition per day, the probability to move on after d days
+            in a state is exp(2 * (d - 3.2)), ~100% by day 4 as per paper.
+            returns: np.ndarray, indices of persons that became Removed today
+        """
+        self.day += 1
+        if self.event_driven:
+            due = self._pop_events(self.transitions, self.transition_day)
+            to_removed = due[self.state[due] == INFECTED]
+            self.set_state(due[self.state[due] == EXPOSED], INFECTED, EXPOSED)
+            self.set_state(to_removed, REMOVED, INFECTED)
+            return to_removed
+
+        self.total_days += 1
+        exposed = np.flatnonzero(self.state == EXPOSED)
+        infected = np.flatnonzero(self.state == INFECTED)
+
+        self.days_exposed[exposed] += 1
+        p = np.exp(2 * (self.days_exposed[exposed] - 3.2))
+        to_infected = exposed[uniform(self.rng, exposed) < p]
+        self.set_state(to_infected, INFECTED, EXPOSED)
+        self.days_exposed[to_infected] = 0
+
+        self.days_infected[infected] += 1
+        p = np.exp(2 * (self.days_infected[infected] - 3.2))
+        to_removed = infected[uniform(self.rng, infected) < p]
+        self.set_state(to_removed, REMOVED, INFECTED)
+        self.days_infected[to_removed] = 0
+        return to_removed
+
+
+    def count_down_quarantine(self) -> None:
+        """
+            Count one more day of quarantine and release everyone who has been quarantined for 8 days,
+            after 8 days someone would not be Exposed or Infected anymore.
+        """
+        if self.event_driven:
+            released = self._pop_events(self.releases, self.release_day)
+            self.release(released[self.quarantined[released]])
+            return
+
+        quarantined = np.flatnonzero(self.quarantined)
+        self.days_quarantined[quarantined] += 1
+        released = quarantined[self.days_quarantined[quarantined] >= 8]
+        self.release(released)
+        self.days_quarantined[released] = 0
+
+
+    def quarantine(self, indices: np.ndarray) -> None:
+        """
+            Put the given persons in quarantine, persons that already are quarantined stay so.
+        """
+        indices = np.unique(indices[~self.quarantined[indices]])
+        self.quarantined[indices] = True
+        self.n_quarantined += len(indices)
+        if self.event_driven:
+            # the quarantine is counted down from today on, so it ends on the 8th day including today
+            self._schedule(self.releases, self.release_day, indices, np.full(len(indices), self.day + QUARANTINE_DAYS - 1))
+
+
+    def release(self, indices: np.ndarray) -> None:
+        """
+            End the quarantine of the given persons.
+        """
+        indices = np.unique(indices[self.quarantined[indices]])
+        self.quarantined[indices] = False
+        self.n_quarantined -= len(indices)
+
+
+    def set_state(self, indices: np.ndarray, new_state: int, old_state: int = None) -> None:
+        """
+            Move the given persons to new_state and update the state counts.
+            params: indices: np.ndarray, indices of distinct persons
+                    new_state: int, state code to move to
+                    old_state: int, state code all persons are in now, looked up per person if not given
+        """
+        if old_state is None:
+            self.counts -= np.bincount(self.state[indices], minlength=len(STATE_NAMES))
+            leaving_infected = indices[self.state[indices] == INFECTED]
+        else:
+            self.counts[old_state] -= len(indices)
+            leaving_infected = indices if old_state == INFECTED else indices[:0]
+        self.counts[new_state] += len(indices)
+        self.state[indices] = new_state
+
+        if len(leaving_infected):
+            self.infected = np.setdiff1d(self.infected, leaving_infected, assume_unique=True)
+        if new_state == INFECTED:
+            self.infected = np.union1d(self.infected, indices)
+        if self.event_driven:
+            if new_state in (EXPOSED, INFECTED):
+                delay = np.searchsorted(TRANSITION_DELAY_CDF, uniform(self.rng, indices), side='right') + 1
+                self._schedule(self.transitions, self.transition_day, indices, self.day + delay)
+            else:
+                self.transition_day[indices] = -1
+
+
+    def _schedule(self, calendar: dict, event_day: np.ndarray, indices: np.ndarray, days: np.ndarray) -> None:
+        """
+            Schedule an event for each person on the given day, replacing any earlier event of the same kind.
+        """
+        event_day[indices] = days
+        for day in np.unique(days):
+            calendar.setdefault(int(day), []).append(indices[days == day])
+
+
+    def _pop_events(self, calendar: dict, event_day: np.ndarray) -> np.ndarray:
+        """
+            Remove and return the persons with an event today, events that were replaced later are skipped.
+        """
+        events = calendar.pop(self.day, [])
+        if not events:
+            return np.empty(0, dtype=np.int64)
+        indices = np.unique(np.concatenate(events))
+        indices = indices[event_day[indices] == self.day]
+        event_day[indices] = -1
+        return indices
+
+
+    def infect(self, targets: np.ndarray) -> np.ndarray:
+        """
+            Each index in targets had contact with an infected person. Susceptible targets become
+            Exposed with a fixed probability per contact, 80% for careless and 45% for other persons.
+            params: targets: np.ndarray, indices of contacted persons, may contain duplicates
+            returns: np.ndarray, indices of persons that became Exposed
+        """
+        targets = targets[self.state[targets] == SUSCEPTIBLE]
+        infection_chance = np.where(self.careless[targets], 0.8, 0.45)
+        exposed = np.unique(targets[uniform(self.rng, targets) < infection_chance])
+        self.set_state(exposed, EXPOSED, SUSCEPTIBLE)
+        self.days_exposed[exposed] = 0
+        return exposed
@@ -0,0 +1,113 @@
+import contextlib
+import json
+import time
+import tracemalloc
+
+
+class Profiler:
+    def __init__(self, track_memory: bool = False):
+        """
+            Records the wall time, number of calls and optionally the allocated memory of each phase of a run.
+            Phases can be nested, a phase is identified by its path of phase names, e.g. ('timestep', 'infect').
+            Totals are kept over the whole run and per day, see start_day.
+            params: track_memory: bool, also record the net memory allocated in each phase with tracemalloc,
+                    this makes the run several times slower
+        """
+        self.enabled = True
+        self.track_memory = track_memory
+        self.phases = {}  # path -> [calls, seconds, self seconds, net allocated bytes]
+        self.days = []  # per day, (day, {path: [calls, seconds, net allocated bytes]})
+        self._stack = []  # [path, start time, seconds spent in child phases] of each open phase
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+    def start_day(self, day: int) -> None:
+        """
+            Count the phases from now on to the given day.
+        """
+        self.days.append((day, {}))
+
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        path = self._stack[-1][0] + (name,) if self._stack else (name,)
+        memory = tracemalloc.get_traced_memory()[0] if self.track_memory else 0
+        frame = [path, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - frame[1]
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            net_bytes = tracemalloc.get_traced_memory()[0] - memory if self.track_memory else 0
+            totals = self.phases.setdefault(path, [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] += elapsed - frame[2]
+            totals[3] += net_bytes
+            if self.days:
+                day_totals = self.days[-1][1].setdefault(path, [0, 0.0, 0])
+                day_totals[0] += 1
+                day_totals[1] += elapsed
+                day_totals[2] += net_bytes
+
+
+    def __getstate__(self) -> dict:
+        # a profiler is pickled with a checkpoint from within a phase, a resumed run starts without open phases
+        state = self.__dict__.copy()
+        state['_stack'] = []
+        return state
+
+
+    def to_dict(self) -> dict:
+        """
+            returns: dict with the totals of every phase and the calls, time and memory per phase of every day,
+                     json serializable
+        """
+        phases = [{'phase': ';'.join(path), 'calls': calls, 'seconds': seconds, 'self_seconds': self_seconds,
+                   'net_bytes': net_bytes if self.track_memory else None}
+                  for path, (calls, seconds, self_seconds, net_bytes) in self.phases.items()]
+        days = [{'day': day, 'phases': [{'phase': ';'.join(path), 'calls': calls, 'seconds': seconds,
+                                         'net_bytes': net_bytes if self.track_memory else None}
+                                        for path, (calls, seconds, net_bytes) in day_phases.items()]}
+                for day, day_phases in self.days]
+        return {'phases': phases, 'days': days}
+
+
+    def folded(self) -> str:
+        """
+            Profile in the folded stack format of flamegraph.pl and speedscope, one line per phase
+            with its path and self time in microseconds.
+        """
+        return '\n'.join(f"{';'.join(path)} {round(self_seconds * 1e6)}"
+                         for path, (_, _, self_seconds, _) in self.phases.items()) + '\n'
+
+
+    def save(self, path: str) -> None:
+        """
+            Save the profile as json to path and in folded stack format to path with .folded instead of .json.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        with open(path.removesuffix('.json') + '.folded', 'w') as f:
+            f.write(self.folded())
+
+
+class NullProfiler:
+    """
+        Profiler that records nothing, used when profiling is disabled. Its phase is a shared no-op context.
+    """
+    enabled = False
+    _null = contextlib.nullcontext()
+
+    def start_day(self, day: int) -> None:
+        pass
+
+    def phase(self, name: str):
+        return self._null
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,454 @@
+import json
+import os
+import struct
+import zipfile
+import numpy as np
+from population import QUARANTINE_EVENT_DTYPE
+
+# every series of a run is appended to its own raw binary file in the store directory,
+# quarantine_log holds one record per notification so its length differs between runs,
+# the histories of a run that ended early are stored up to the day the disease died out
+SERIES_DTYPES = {
+    'history_E': np.int32,
+    'history_I': np.int32,
+    'history_S': np.int32,
+    'history_R': np.int32,
+    'history_Q': np.int32,
+    'quarantine_log': QUARANTINE_EVENT_DTYPE,
+}
+INDEX_FILE = 'runs.jsonl'
+META_FILE = 'meta.json'
+SUMMARY_FILE = 'summary.npz'  # summary inside a store directory
+SUMMARY_SUFFIX = '.summary.npz'  # summary next to an .npz archive
+SUMMARY_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+CONVERGENCE_METRICS = ('attack_rate', 'peak_I', 'quarantine_precision')  # per run metrics of confidence_half_widths
+STATE_SERIES = ('history_E', 'history_I', 'history_S', 'history_R')
+
+
+class ResultsWriter:
+    def __init__(self, path: str, num_days: int, n_total: int, params: dict = None):
+        """
+            Appendable on-disk store for the results of the runs of one parameter cell.
+            Each finished run is appended to one typed binary file per series, after which a line with the
+            seed and the offset of the run in every file is appended to the run index. A run only counts
+            once its index line is written, so an interrupted sweep keeps all runs that finished before.
+            params: path: str, directory of the store, created if it does not exist
+                    num_days: int, number of simulated days per run
+                    n_total: int, number of persons in the graph
+                    params: dict, parameters of the cell, saved in the meta data
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            meta = {'num_days': num_days, 'n_total': n_total, 'params': params or {},
+                    'dtypes': {name: np.lib.format.dtype_to_descr(np.dtype(dtype)) for name, dtype in SERIES_DTYPES.items()}}
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f, indent=2)
+        # the series of an existing store are kept, also when it was written by an older version
+        with open(meta_path) as f:
+            self.dtypes = {name: _dtype(descr) for name, descr in json.load(f)['dtypes'].items()}
+
+        self.runs = _read_index(path)
+        self._truncate_unindexed()
+        self.index = open(os.path.join(path, INDEX_FILE), 'a')
+
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.runs)
+
+
+    def append(self, replicate: int, seed: int, result: dict) -> None:
+        """
+            Append a finished run to the store.
+            params: replicate: int, index of the run within the cell
+                    seed: int, seed of the run
+                    result: dict, series of the run as returned by run_simulation
+        """
+        record = {'replicate': replicate, 'seed': int(seed), 'series': {}}
+        for name, dtype in self.dtypes.items():
+            values = np.asarray(result[name], dtype=dtype)
+            with open(os.path.join(self.path, f'{name}.bin'), 'ab') as f:
+                offset = f.tell() // values.itemsize
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            record['series'][name] = [offset, len(values)]
+
+        self.index.write(json.dumps(record) + '\n')
+        self.index.flush()
+        os.fsync(self.index.fileno())
+        self.runs.append(record)
+
+
+    def close(self) -> None:
+        """
+            Close the run index and write the summary of all runs stored so far.
+        """
+        self.index.close()
+        write_summary(self.path)
+
+
+    def _truncate_unindexed(self) -> None:
+        """
+            Cut off data of runs that were being written when a previous sweep was interrupted.
+        """
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                complete = f.read().rfind(b'\n') + 1
+            with open(index_path, 'r+b') as f:
+                f.truncate(complete)
+        for name, dtype in self.dtypes.items():
+            file_path = os.path.join(self.path, f'{name}.bin')
+            if not os.path.exists(file_path):
+                continue
+            end = max((sum(run['series'][name]) for run in self.runs), default=0)
+            if os.path.getsize(file_path) > end * np.dtype(dtype).itemsize:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(end * np.dtype(dtype).itemsize)
+
+
+class _Reader:
+    """
+        Streaming statistics over the runs of a series, shared by the store and archive readers.
+        Subclasses provide num_days, n_total, n_runs and series(name, runs, days).
+    """
+
+    def mean(self, name: str, chunk_runs: int = 256) -> np.ndarray:
+        """
+            Mean of a series over all runs, read chunk_runs runs at a time.
+            returns: np.ndarray of length num_days
+        """
+        total = np.zeros(self.num_days)
+        for chunk in self._chunks(name, chunk_runs):
+            total += chunk.sum(axis=0, dtype=np.float64)
+        return total / max(self.n_runs, 1)
+
+
+    def std(self, name: str, chunk_runs: int = 256) -> np.ndarray:
+        """
+            Standard deviation of a series over all runs, read chunk_runs runs at a time in a single pass.
+            The mean and the sum of squared deviations of every chunk are merged into those of the runs before it
+            (Chan et al.), which is as accurate as summing the squared deviations from the overall mean.
+            returns: np.ndarray of length num_days
+        """
+        count = 0
+        mean = np.zeros(self.num_days)
+        squares = np.zeros(self.num_days)
+        for chunk in self._chunks(name, chunk_runs):
+            n = len(chunk)
+            chunk_mean = chunk.sum(axis=0, dtype=np.float64) / n
+            delta = chunk_mean - mean
+            squares += ((chunk - chunk_mean) ** 2).sum(axis=0) + delta ** 2 * (count * n / (count + n))
+            mean += delta * (n / (count + n))
+            count += n
+        return np.sqrt(squares / max(count, 1))
+
+
+    def quantiles(self, name: str, q, chunk_days: int = 16) -> np.ndarray:
+        """
+            Exact quantiles of a series per day over all runs, read chunk_days days of all runs at a time,
+            so memory grows with the number of runs and not with the size of the population.
+            The q-quantile is the smallest count that at least a fraction q of the runs is at or below
+            (numpy's 'inverted_cdf' method).
+            params: q: float or sequence of floats in [0, 1]
+            returns: np.ndarray of shape (len(q), num_days), or (num_days,) for a single q
+        """
+        q = np.asarray(q, dtype=np.float64)
+        result = np.zeros((q.size, self.num_days), dtype=np.int64)
+        if self.n_runs:
+            for start in range(0, self.num_days, chunk_days):
+                chunk = np.asarray(self.series(name, days=slice(start, start + chunk_days)))
+                result[:, start:start + chunk_days] = np.quantile(chunk, q.ravel(), axis=0, method='inverted_cdf')
+        return result.reshape(q.shape + (self.num_days,))
+
+
+    def _chunks(self, name: str, chunk_runs: int):
+        """
+            yields: (runs, num_days) arrays of a series with chunk_runs runs each, only one chunk is gathered at a time
+        """
+        for start in range(0, self.n_runs, chunk_runs):
+            yield self.series(name, runs=slice(start, start + chunk_runs))
+
+
+class ResultsReader(_Reader):
+    def __init__(self, path: str):
+        """
+            Read access to a store written by ResultsWriter, series are memory mapped and only read when used.
+            params: path: str, directory of the store
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.num_days = self.meta['num_days']
+        self.n_total = self.meta['n_total']
+        self.runs = _read_index(path)
+
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.runs)
+
+
+    def ragged(self, name: str) -> list[np.ndarray]:
+        """
+            Return the series of every run as a list of arrays, runs may have different lengths.
+            history_quarantined is derived from the quarantine log for stores that do not hold it.
+        """
+        if name == 'history_quarantined' and name not in self.meta['dtypes']:
+            return [events['was_infected'][events['passed_self_test']].astype(np.int8)
+                    for events in self.ragged('quarantine_log')]
+        data = self._memmap(name)
+        return [data[offset:offset + length] for offset, length in (run['series'][name] for run in self.runs)]
+
+
+    def series(self, name: str, runs: slice = slice(None), days: slice = slice(None)) -> np.ndarray:
+        """
+            Return a (runs, days) array of a history, of all runs and days by default.
+            When the runs are complete and stored back to back, as ResultsWriter writes them, this is a memory
+            mapped view. Otherwise only the selected runs and days are gathered, and the history of a run that
+            ended early is continued with its last day, as nothing changes anymore once the disease died out.
+            params: runs: slice, runs to return
+                    days: slice, days to return
+        """
+        selected = self.runs[runs]
+        day_indices = np.arange(self.num_days)[days]
+        if not selected:
+            return np.empty((0, len(day_indices)), dtype=_dtype(self.meta['dtypes'][name]))
+        offsets, lengths = np.array([run['series'][name] for run in selected]).T
+        if np.all(lengths == self.num_days) and np.array_equal(offsets, offsets[0] + np.arange(len(selected)) * self.num_days):
+            data = self._memmap(name)[offsets[0]:offsets[0] + len(selected) * self.num_days]
+            return data.reshape(len(selected), self.num_days)[:, days]
+        return self._memmap(name)[offsets[:, None] + np.minimum(day_indices, lengths[:, None] - 1)]
+
+
+    def quarantine_load(self) -> np.ndarray:
+        """
+            Number of persons that went into quarantine on each day, from the quarantine log.
+            returns: np.ndarray of shape (runs, num_days), day 1 is the first column
+        """
+        load = np.zeros((self.n_runs, self.num_days), dtype=np.int32)
+        for run, events in zip(load, self.ragged('quarantine_log')):
+            days = events['day'][events['passed_self_test']]
+            run += np.bincount(days - 1, minlength=self.num_days)[:self.num_days]
+        return load
+
+
+    def _memmap(self, name: str) -> np.ndarray:
+        file_path = os.path.join(self.path, f'{name}.bin')
+        dtype = _dtype(self.meta['dtypes'][name])
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode='r')
+
+
+def _dtype(descr) -> np.dtype:
+    # json turns the (name, type) tuples of a structured dtype into lists
+    if isinstance(descr, list):
+        descr = [tuple(field) for field in descr]
+    return np.lib.format.descr_to_dtype(descr)
+
+
+def _read_index(path: str) -> list[dict]:
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+    runs = []
+    with open(index_path) as f:
+        for line in f:
+            if line.endswith('\n'):  # a line without newline was cut off by an interruption
+                runs.append(json.loads(line))
+    return runs
+
+
+class ArchiveReader(_Reader):
+    # series names of the store that are saved under another name in the .npz archives of main.py
+    ARCHIVE_NAMES = {'history_quarantined': 'history_quarantaine'}
+
+    def __init__(self, path: str):
+        """
+            Read access to an .npz archive as written by np.savez, without pickle.
+            Uncompressed arrays are memory mapped directly from the archive, compressed ones are read when used.
+            params: path: str, path of the .npz archive
+        """
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            self.members = {info.filename.removesuffix('.npy'): info for info in archive.infolist()}
+        self.num_days = int(self._load('num_days'))
+        self.n_total = int(self._load('n_total'))
+        self.n_runs = len(self.series('history_E'))
+
+
+    def series(self, name: str, runs: slice = slice(None), days: slice = slice(None)) -> np.ndarray:
+        """
+            Return the (runs, days) array of a series, of all runs and days by default,
+            history_quarantined is padded with -1.
+            params: runs: slice, runs to return
+                    days: slice, days to return
+        """
+        return self._load(self.ARCHIVE_NAMES.get(name, name))[runs, days]
+
+
+    def ragged(self, name: str) -> list[np.ndarray]:
+        """
+            Return the series of every run as a list of arrays, the -1 padding of history_quarantined is cut off.
+        """
+        data = self.series(name)
+        if name not in self.ARCHIVE_NAMES:
+            return list(data)
+        if data.shape[1] == 0:
+            return [run[:0] for run in data]  # e.g. no quarantines in any run without app users
+        lengths = data.shape[1] - np.argmax(data[:, ::-1] != -1, axis=1)
+        lengths[np.all(data == -1, axis=1)] = 0
+        return [run[:length] for run, length in zip(data, lengths)]
+
+
+    def _load(self, name: str) -> np.ndarray:
+        info = self.members[name]
+        if info.compress_type == zipfile.ZIP_STORED:
+            with open(self.path, 'rb') as f:
+                # skip the local file header of the member, followed by the .npy header
+                f.seek(info.header_offset)
+                name_length, extra_length = struct.unpack('<HH', f.read(30)[26:])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                if version in ((1, 0), (2, 0)):
+                    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+                    shape, fortran_order, dtype = read_header(f)
+                    if not dtype.hasobject and np.prod(shape) > 0 and shape != ():
+                        return np.memmap(self.path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+        with zipfile.ZipFile(self.path) as archive, archive.open(info) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+
+
+def summarize(reader) -> dict:
+    """
+        Summary statistics of the runs of one parameter cell.
+        params: reader: ResultsReader or ArchiveReader
+        returns: dict of arrays with, per state series X
+                 X_mean, X_std: per day mean and standard deviation over the runs
+                 X_quantiles: (len(quantiles), num_days) per day quantiles over the runs
+                 and per run
+                 peak_I, peak_day: largest number of Infected persons and the first day (1 based) it was reached
+                 attack_rate: fraction of persons that were ever infected at the end of the run
+                 quarantined_infected, quarantined_healthy: number of quarantines of infected and healthy persons
+                 quarantine_precision: fraction of the quarantines that were of infected persons, nan without quarantines
+                 and, for stores with a quarantine log, quarantine_load_mean: per day mean number of persons going into quarantine
+    """
+    summary = {'n_runs': reader.n_runs, 'num_days': reader.num_days, 'n_total': reader.n_total,
+               'quantiles': np.array(SUMMARY_QUANTILES)}
+    for name in STATE_SERIES:
+        summary[f'{name}_mean'] = reader.mean(name)
+        summary[f'{name}_std'] = reader.std(name)
+        summary[f'{name}_quantiles'] = reader.quantiles(name, SUMMARY_QUANTILES)
+
+    history_I = reader.series('history_I')
+    summary['peak_I'] = history_I.max(axis=1, initial=0)
+    summary['peak_day'] = history_I.argmax(axis=1) + 1 if reader.n_runs and reader.num_days else np.zeros(reader.n_runs, dtype=np.int64)
+    final_S = reader.series('history_S')[:, -1] if reader.num_days else np.empty(0)
+    summary['attack_rate'] = 1 - final_S / reader.n_total
+
+    quarantined = reader.ragged('history_quarantined')
+    infected = np.array([np.count_nonzero(run == 1) for run in quarantined], dtype=np.int64)
+    healthy = np.array([np.count_nonzero(run == 0) for run in quarantined], dtype=np.int64)
+    summary['quarantined_infected'] = infected
+    summary['quarantined_healthy'] = healthy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary['quarantine_precision'] = infected / (infected + healthy)
+    if isinstance(reader, ResultsReader) and 'quarantine_log' in reader.meta['dtypes']:
+        summary['quarantine_load_mean'] = reader.quarantine_load().mean(axis=0)
+    return summary
+
+
+def confidence_half_widths(summary: dict, z: float = 1.96) -> dict:
+    """
+        Half width of the normal confidence interval of the mean over the runs of every convergence metric,
+        by default the 95% interval. peak_I is taken as a fraction of the population, so every metric is a
+        fraction. Runs without quarantines have no quarantine precision and are left out of it, a metric
+        that none of the runs have, e.g. without quarantining, is left out.
+        params: summary: dict, see summarize
+                z: float, number of standard errors on each side of the mean
+        returns: dict, metric -> half width, inf when only one run has the metric
+    """
+    half_widths = {}
+    for name in CONVERGENCE_METRICS:
+        values = np.asarray(summary[name], dtype=np.float64)
+        if name == 'peak_I':
+            values = values / summary['n_total']
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            continue
+        half_widths[name] = z * values.std(ddof=1) / np.sqrt(len(values)) if len(values) > 1 else np.inf
+    return half_widths
+
+
+def summary_path(path: str) -> str:
+    return os.path.join(path, SUMMARY_FILE) if is_results_store(path) else path.removesuffix('.npz') + SUMMARY_SUFFIX
+
+
+def write_summary(path: str) -> dict:
+    """
+        Compute the summary of a store directory or .npz archive and save it next to the results.
+        returns: dict, the summary
+    """
+    summary = summarize(open_results(path))
+    tmp_path = summary_path(path) + '.tmp.npz'
+    np.savez(tmp_path, **summary)
+    os.replace(tmp_path, summary_path(path))
+    return summary
+
+
+def load_summary(path: str) -> dict:
+    """
+        Load the summary of a store directory or .npz archive, it is (re)computed when it is missing or
+        does not cover all runs of the results.
+        returns: dict, see summarize
+    """
+    file_path = summary_path(path)
+    if os.path.exists(file_path):
+        with np.load(file_path) as f:
+            summary = dict(f)
+        if is_results_store(path):
+            up_to_date = summary['n_runs'] == len(_read_index(path))
+        else:
+            up_to_date = os.path.getmtime(file_path) >= os.path.getmtime(path)
+        if up_to_date:
+            return summary
+    return write_summary(path)
+
+
+def is_results_store(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def open_results(path: str):
+    """
+        Open the results of one parameter cell, either a store directory or an .npz archive.
+        returns: ResultsReader or ArchiveReader, nothing is read until a series is used
+    """
+    return ResultsReader(path) if is_results_store(path) else ArchiveReader(path)
+
+
+def load_results(path: str) -> dict:
+    """
+        Load the results of one parameter cell, either from a store directory or from an .npz archive.
+        returns: dict with the history_E, history_I, history_S, history_R and history_quarantaine arrays, num_days and n_total,
+                 history_quarantaine is padded with -1 to the longest run
+    """
+    reader = open_results(path)
+    data = {name: reader.series(name) for name in ('history_E', 'history_I', 'history_S', 'history_R')}
+    quarantaine = reader.ragged('history_quarantined')
+    padded = np.full((len(quarantaine), max(map(len, quarantaine), default=0)), -1, dtype=np.int8)
+    for run, values in zip(padded, quarantaine):
+        run[:len(values)] = values
+    data['history_quarantaine'] = padded
+    if isinstance(reader, ResultsReader):
+        data['seeds'] = np.array([run['seed'] for run in reader.runs], dtype=np.uint64)
+    elif 'seeds' in reader.members:
+        data['seeds'] = reader.series('seeds')
+    data['num_days'] = reader.num_days
+    data['n_total'] = reader.n_total
+    return data
@@ -0,0 +1,191 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from graph import Graph
+from batched import BatchedGraph
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from graph_cache import GraphCache
+from profiling import Profiler, NULL_PROFILER
+
+
+def job_seed(base_seed: int, cell: int, replicate: int) -> int:
+    """
+        Deterministic seed of one simulation run, independent of the order in which the runs are executed.
+        params: base_seed: int, seed of the whole sweep
+                cell: int, index of the parameter cell
+                replicate: int, index of the run within the cell
+        returns: int, seed of the run
+    """
+    return int(np.random.SeedSequence([base_seed, cell, replicate]).generate_state(1)[0])
+
+
+def run_simulation(graph_params: dict, seed: int, num_days: int = 210,
+                   percentage_neighbourhood_contacts: float = 1, checkpoint_path: str = None,
+                   checkpoint_every: int = 0, profile: bool = False, profile_memory: bool = False,
+                   graph_cache: GraphCache = None) -> dict:
+    """
+        Run a single simulation of num_days days.
+        params: graph_params: dict, keyword arguments of Graph
+                seed: int, seed of the random number generators of this run
+                num_days: int, number of days to simulate
+                percentage_neighbourhood_contacts: float, percentage of residents that meet someone outside their neighbourhood each day
+                checkpoint_path: str, file to save the state of the run to, the run resumes from it if it exists
+                checkpoint_every: int, number of days between checkpoints, 0 to never save one
+                profile: bool, record the time spent in each phase of every day, see profiling.Profiler
+                profile_memory: bool, also record the memory allocated in each phase, much slower
+                graph_cache: GraphCache, cache to load the contact network of a network_seed from instead of building it
+        returns: dict with the history_E, history_I, history_S, history_R and history_Q lists of the run,
+                 which end at the day the disease died out when that is before num_days,
+                 the quarantine_log records of the run and the history_quarantined array derived from them,
+                 and the Profiler of the run under 'profile' when profiling
+    """
+    profiler = Profiler(track_memory=profile_memory) if profile or profile_memory else NULL_PROFILER
+
+    # initialize graph, or continue from the last checkpoint of an interrupted run
+    graph, last_day = load_checkpoint(checkpoint_path) if checkpoint_path else (None, None)
+    if graph is None or graph.seed != seed:
+        with profiler.phase('construct_graph'):
+            if graph_cache is not None:
+                graph_params = graph_cache.with_network(graph_params)
+            graph, last_day = Graph(**graph_params, seed=seed), -1
+    elif profiler.enabled and graph.profiler.enabled:
+        profiler = graph.profiler  # continue the profile of the interrupted run
+    graph.profiler = profiler
+
+    edge_graphs = []
+    #pos, x_max, y_max = graph._fix_node_positions()
+
+    for i in range(last_day + 1, num_days):
+        #print(f"\nTimestep {i+1}\n")
+        profiler.start_day(i + 1)
+
+        with profiler.phase('make_neighbourhood_contacts'):
+            graph.make_neighbourhood_contacts(percentage=percentage_neighbourhood_contacts)
+
+        if i % 5 == 0:
+            with profiler.phase('snapshot'):
+                edge_graph = graph.A.copy()
+                infected_ids = graph._get_infected_ids()
+                edge_graphs.append((edge_graph, infected_ids))
+
+        with profiler.phase('timestep'):
+            graph.timestep(i=i)
+
+        with profiler.phase('delete_neighbourhood_contacts'):
+            graph.delete_neighbourhood_contacts()
+
+        if graph.history_E[-1] == 0 and graph.history_I[-1] == 0:
+            # the remaining days would repeat the last day, the histories end here, see ResultsReader.series
+            print(f"Simulation ended early at day {i+1} as there are no more Exposed or Infected individuals.")
+            break
+
+        if checkpoint_every and (i + 1) % checkpoint_every == 0 and i + 1 < num_days:
+            with profiler.phase('checkpoint'):
+                save_checkpoint(checkpoint_path, graph, i)
+
+    if checkpoint_path:
+        remove_checkpoint(checkpoint_path)
+
+    # uncomment to plot graphs at each 6th timestep
+    #for idx, g in enumerate(edge_graphs):
+    #    plot_graph(*g, (idx*5) + 1, pos)
+
+    return {
+        'history_E': graph.history_E,
+        'history_I': graph.history_I,
+        'history_S': graph.history_S,
+        'history_R': graph.history_R,
+        'history_Q': graph.history_Q,
+        'history_quarantined': graph.history_quarantined,
+        'quarantine_log': graph.quarantine_events.copy(),
+        'n_total': len(graph.population),
+        'seed': seed,
+        **({'profile': profiler} if profiler.enabled else {}),
+    }
+
+
+def run_batch(graph_params: dict, seeds: list, num_days: int = 210, percentage_neighbourhood_contacts: float = 1,
+              checkpoint_path: str = None, checkpoint_every: int = 0, profile: bool = False,
+              profile_memory: bool = False, graph_cache: GraphCache = None) -> list[dict]:
+    """
+        Run the replicates with the given seeds of one parameter cell together in lockstep, see BatchedGraph.
+        params: as run_simulation, with seeds: list of int, seed of every replicate
+        returns: list of dicts in the format of run_simulation, one per seed, the first one holds the profile when profiling
+    """
+    profiler = Profiler(track_memory=profile_memory) if profile or profile_memory else NULL_PROFILER
+
+    # initialize the batch, or continue from the last checkpoint of an interrupted batch
+    graph, last_day = load_checkpoint(checkpoint_path) if checkpoint_path else (None, None)
+    if graph is None or graph.seeds != list(seeds):
+        with profiler.phase('construct_graph'):
+            graph, last_day = BatchedGraph(graph_params, seeds, graph_cache=graph_cache), -1
+    elif profiler.enabled and graph.profiler.enabled:
+        profiler = graph.profiler  # continue the profile of the interrupted batch
+    graph.profiler = profiler
+
+    for i in range(last_day + 1, num_days):
+        profiler.start_day(i + 1)
+
+        with profiler.phase('make_neighbourhood_contacts'):
+            graph.make_neighbourhood_contacts(percentage=percentage_neighbourhood_contacts)
+
+        with profiler.phase('timestep'):
+            graph.timestep(i=i)
+
+        with profiler.phase('delete_neighbourhood_contacts'):
+            graph.delete_neighbourhood_contacts()
+
+        if not graph.alive.any():
+            print(f"Batch ended early at day {i+1} as there are no more Exposed or Infected individuals in any replicate.")
+            break
+
+        if checkpoint_every and (i + 1) % checkpoint_every == 0 and i + 1 < num_days:
+            with profiler.phase('checkpoint'):
+                save_checkpoint(checkpoint_path, graph, i)
+
+    if checkpoint_path:
+        remove_checkpoint(checkpoint_path)
+
+    results = graph.results()
+    if profiler.enabled:
+        results[0]['profile'] = profiler
+    return results
+
+
+def _run_job(job: tuple) -> list[tuple]:
+    cell, replicate, graph_params, seed, kwargs = job
+    if not isinstance(replicate, list):
+        return [(cell, replicate, seed, run_simulation(graph_params, seed, **kwargs))]
+    return [(cell, r, s, result) for r, s, result in zip(replicate, seed, run_batch(graph_params, seed, **kwargs))]
+
+
+def run_jobs(jobs: list, max_workers: int = None):
+    """
+        Run independent simulation jobs on a process pool and yield the results as soon as they finish.
+        params: jobs: iterable of (cell, replicate, graph_params, seed, kwargs) tuples, kwargs are passed to run_simulation.
+                      For a batch job replicate and seed are lists, and the runs are done together by run_batch
+                max_workers: int, number of worker processes, defaults to the number of cores
+        yields: (cell, replicate, seed, result) tuples in order of completion
+    """
+    if max_workers == 1:
+        # run in this process, e.g. for debugging and profiling
+        for job in jobs:
+            yield from _run_job(job)
+        return
+
+    max_workers = max_workers or os.cpu_count()
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        # only a few jobs per worker are submitted at a time and finished futures are dropped as soon as their
+        # results are yielded, so neither the queued jobs nor the results pile up in memory
+        jobs = iter(jobs)
+        pending = {pool.submit(_run_job, job) for job in itertools.islice(jobs, 2 * max_workers)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending |= {pool.submit(_run_job, job) for job in itertools.islice(jobs, len(done))}
+            while done:
+                yield from done.pop().result()
+    finally:
+        # on an error, or when the caller stops early, the jobs that did not start yet are not run
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class ReplicateStreams:
+    def __init__(self, rngs: list, block_size: int):
+        """
+            Random streams of a batch of replicates that are stacked into one population, replicate r holds the
+            persons r * block_size up to (r + 1) * block_size. Every number drawn for a person comes from the
+            stream of its replicate, so what happens in a replicate only depends on its own seed.
+            params: rngs: list of np.random.Generator, one stream per replicate
+                    block_size: int, number of persons per replicate
+        """
+        self.rngs = rngs
+        self.block_size = block_size
+
+
+    def uniform(self, indices: np.ndarray) -> np.ndarray:
+        """
+            Draw one uniform number in [0, 1) for each index from the stream of its replicate. The numbers of
+            a replicate are drawn in the order its indices appear in.
+        """
+        if len(indices) == 0:
+            return np.empty(0)
+        replicate = indices // self.block_size
+        counts = np.bincount(replicate, minlength=len(self.rngs))
+        draws = np.concatenate([rng.random(count) for rng, count in zip(self.rngs, counts) if count])
+        if np.all(replicate[1:] >= replicate[:-1]):
+            return draws  # indices are grouped by replicate already, e.g. when sorted
+        order = np.argsort(replicate, kind='stable')
+        unsorted = np.empty(len(indices))
+        unsorted[order] = draws
+        return unsorted
+
+
+def uniform(rng, indices: np.ndarray) -> np.ndarray:
+    """
+        Draw one uniform number in [0, 1) for each index.
+        params: rng: np.random.Generator, or ReplicateStreams to draw each number from the stream of the replicate of its index
+                indices: np.ndarray, indices of the persons to draw for
+    """
+    if isinstance(rng, ReplicateStreams):
+        return rng.uniform(indices)
+    return rng.random(len(indices))